@@ -0,0 +1,235 @@
+"""
+Microbenchmarks for the tree processing and command matching code.
+
+Usage:
+    python -m benchmarks.run [--output FILE] [--compare FILE] [--quick]
+
+Results are written as JSON so that runs can be compared to catch scaling
+regressions. With --compare, the results are checked against a previous run
+and the exit status is non-zero if anything got slower than the threshold.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from i3_resurrect import config
+from i3_resurrect import programs
+from i3_resurrect import session
+from i3_resurrect import storage
+from i3_resurrect import treeutils
+
+from . import treegen
+
+# (outputs, workspaces per output, windows per workspace, split depth)
+SIZES = [
+    (1, 4, 10, 3),
+    (2, 10, 50, 4),
+    (3, 20, 200, 6),
+]
+QUICK_SIZES = SIZES[:1]
+
+# Numbers of window command mappings in the config.
+MAPPING_COUNTS = [10, 100, 500]
+QUICK_MAPPING_COUNTS = MAPPING_COUNTS[:1]
+
+
+class StaticConnection:
+    """
+    Stands in for the i3 connection, replying with a fixed tree.
+    """
+
+    def __init__(self, tree):
+        self.data = json.dumps(tree)
+
+    def _message(self, message_type, payload):
+        return self.data
+
+
+def measure(func, repeat):
+    """
+    Run a function a number of times and return the timings in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_tree(sizes, repeat):
+    """
+    Benchmark the tree functions for each size of tree.
+    """
+    results = []
+    for outputs, workspaces, windows, depth in sizes:
+        generator = treegen.TreeGenerator(
+            outputs=outputs,
+            workspaces=workspaces,
+            windows=windows,
+            depth=depth,
+        )
+        root = generator.root()
+        containers = treegen.count_containers(root)
+        params = {
+            'outputs': outputs,
+            'workspaces': workspaces,
+            'windows': windows,
+            'depth': depth,
+            'containers': containers,
+        }
+        swallow = ['class', 'instance', 'title']
+        index = treeutils.WorkspaceIndex(root)
+        names = [ws['name'] for ws in index.workspaces]
+
+        processed = treeutils.process_node(root, swallow, {})
+        connection = StaticConnection(root)
+
+        def parse_tree():
+            session.Session(connection).get_tree()
+
+        def lookup_all():
+            for name in names:
+                treeutils.get_workspace_tree(name, False)
+
+        # Warm up the snapshot so that only the lookups are timed.
+        session._session = session.Session(connection)
+        lookup_all()
+
+        cases = [
+            ('session.Session.get_tree', parse_tree),
+            ('treeutils.WorkspaceIndex',
+             lambda: treeutils.WorkspaceIndex(root)),
+            ('treeutils.get_workspace_tree', lookup_all),
+            ('treeutils.process_node',
+             lambda: treeutils.process_node(root, swallow, {})),
+            ('treeutils.get_leaves',
+             lambda: sum(1 for _ in treeutils.get_leaves(root))),
+            ('storage.iterencode_compact',
+             lambda: sum(map(len, storage.iterencode_compact(processed)))),
+        ]
+        for name, func in cases:
+            results.append(result(name, params, measure(func, repeat)))
+    return results
+
+
+def bench_commands(mapping_counts, repeat):
+    """
+    Benchmark window command matching for each number of mappings.
+    """
+    results = []
+    generator = treegen.TreeGenerator()
+    windows = [generator.window_properties() for _ in range(200)]
+    for count in mapping_counts:
+        mappings = treegen.window_command_mappings(count)
+        config._config = {'window_command_mappings': mappings}
+        params = {'mappings': count, 'windows': len(windows)}
+
+        def get_commands():
+            for window_properties in windows:
+                programs.get_window_command(
+                    window_properties,
+                    ['/usr/bin/program', '--arg'],
+                    '/usr/bin/program',
+                )
+
+        def score_rules():
+            for window_properties in windows:
+                for rule in mappings:
+                    programs.calc_rule_match_score(rule, window_properties)
+
+        cases = [
+            ('programs.get_window_command', get_commands),
+            ('programs.calc_rule_match_score', score_rules),
+        ]
+        for name, func in cases:
+            results.append(result(name, params, measure(func, repeat)))
+    return results
+
+
+def result(name, params, timings):
+    return {
+        'benchmark': name,
+        'params': params,
+        'repeat': len(timings),
+        'best_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a previous run and return the regressions.
+    """
+    def key(r):
+        return (r['benchmark'], json.dumps(r['params'], sort_keys=True))
+
+    previous = {key(r): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        old = previous.get(key(r))
+        if old is None:
+            continue
+        ratio = r['best_seconds'] / old['best_seconds']
+        if ratio > 1 + threshold:
+            regressions.append((r, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--output', '-o', default='bench_results.json',
+                        help='File to write the results to.')
+    parser.add_argument('--compare', '-c',
+                        help='Results of a previous run to compare with.')
+    parser.add_argument('--threshold', '-t', type=float, default=0.2,
+                        help='Slowdown which counts as a regression.')
+    parser.add_argument('--repeat', '-r', type=int, default=5,
+                        help='Number of times to run each benchmark.')
+    parser.add_argument('--quick', '-q', action='store_true',
+                        help='Only run the smallest sizes.')
+    args = parser.parse_args(argv)
+
+    sizes = QUICK_SIZES if args.quick else SIZES
+    mapping_counts = QUICK_MAPPING_COUNTS if args.quick else MAPPING_COUNTS
+
+    saved_config = config._config
+    saved_session = session._session
+    try:
+        results = bench_tree(sizes, args.repeat)
+        results += bench_commands(mapping_counts, args.repeat)
+    finally:
+        config._config = saved_config
+        session._session = saved_session
+
+    for r in results:
+        params = ', '.join(f'{k}={v}' for k, v in r['params'].items())
+        best = r['best_seconds'] * 1000
+        print(f'{r["benchmark"]:32} {best:10.3f} ms  ({params})')
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for r, ratio in regressions:
+            print(f'Regression: {r["benchmark"]} {r["params"]} is '
+                  f'{ratio:.2f}x slower')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
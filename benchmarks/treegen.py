@@ -0,0 +1,236 @@
+"""
+Generator for synthetic but realistic i3 layout trees.
+
+The trees have the same shape and attributes as the output of
+`i3-msg -t get_tree`, so they can be fed to anything which works with the raw
+tree.
+"""
+import itertools
+import random
+
+# Window classes that are used for windows which aren't terminals.
+APPLICATIONS = [
+    ('Firefox', 'Navigator', 'Mozilla Firefox'),
+    ('qutebrowser', 'qutebrowser', 'qutebrowser'),
+    ('Thunderbird', 'Mail', 'Inbox - Mozilla Thunderbird'),
+    ('Gimp-2.10', 'gimp-2.10', 'GNU Image Manipulation Program'),
+    ('Slack', 'slack', 'Slack | general'),
+    ('mpv', 'gl', 'video.mkv - mpv'),
+    ('Zathura', 'org.pwmt.zathura', 'paper.pdf'),
+]
+
+
+class TreeGenerator:
+    """
+    Builds i3 layout trees.
+
+    Args:
+        outputs: The number of outputs.
+        workspaces: The number of workspaces on each output.
+        windows: The number of tiled windows in each workspace.
+        depth: The maximum nesting depth of split containers.
+        tabbed: The fraction of split containers which are tabbed.
+        stacked: The fraction of split containers which are stacked.
+        floating: The number of floating windows in each workspace.
+        kakoune: The fraction of windows which are Kakoune clients.
+        alacritty: The fraction of windows which are Alacritty shells.
+        seed: Seed for the random number generator.
+    """
+
+    def __init__(self, outputs=1, workspaces=10, windows=10, depth=4,
+                 tabbed=0.1, stacked=0.1, floating=1, kakoune=0.3,
+                 alacritty=0.3, seed=0):
+        self.outputs = outputs
+        self.workspaces = workspaces
+        self.windows = windows
+        self.depth = depth
+        self.tabbed = tabbed
+        self.stacked = stacked
+        self.floating = floating
+        self.kakoune = kakoune
+        self.alacritty = alacritty
+        self.random = random.Random(seed)
+        self._ids = itertools.count(94067985558992, 16)
+        self._window_ids = itertools.count(50331651)
+
+    def root(self):
+        """
+        Build a whole tree including i3's internal output and scratchpad.
+        """
+        outputs = [self._output('__i3', [self._workspace('__i3_scratch', -1)])]
+        for output in range(self.outputs):
+            workspaces = [
+                self.workspace(output * self.workspaces + ws + 1)
+                for ws in range(self.workspaces)
+            ]
+            outputs.append(self._output(f'HDMI-{output + 1}', workspaces))
+        root = self._con('root', 'root')
+        root['nodes'] = outputs
+        root['focus'] = [outputs[-1]['id'], outputs[0]['id']]
+        return root
+
+    def workspace(self, num):
+        """
+        Build a workspace containing windows.
+        """
+        ws = self._workspace(str(num), num)
+        ws['nodes'] = self._split(self.windows, self.depth)
+        ws['floating_nodes'] = [
+            self._floating_con() for _ in range(self.floating)
+        ]
+        ws['focus'] = [con['id'] for con in ws['nodes']]
+        return ws
+
+    def window_properties(self):
+        """
+        Pick the properties of a window.
+        """
+        roll = self.random.random()
+        n = self.random.randrange(1000)
+        if roll < self.kakoune:
+            title = (f'src/module{n}.py {n % 300 + 1}:{n % 80 + 1} '
+                     f'{"[+]" if n % 3 == 0 else ""} {n % 4 + 1} '
+                     f'sel{"s" if n % 4 else ""} - client{n}@[project{n % 5}]'
+                     ' - Kakoune')
+            window_class = ('Alacritty', 'Alacritty')
+        elif roll < self.kakoune + self.alacritty:
+            title = f'user@host:~/src/project{n % 5}'
+            window_class = ('Alacritty', 'Alacritty')
+        else:
+            app = self.random.choice(APPLICATIONS)
+            title = f'{app[2]} ({n})'
+            window_class = app[:2]
+        return {
+            'class': window_class[0],
+            'instance': window_class[1],
+            'title': title,
+            'transient_for': None,
+        }
+
+    def _split(self, windows, depth):
+        # Spread the windows over a number of children, some of which are
+        # nested split containers.
+        if windows <= 1 or depth == 0:
+            return [self._window() for _ in range(windows)]
+        children = []
+        remaining = windows
+        while remaining > 0:
+            if remaining > 1 and self.random.random() < 0.5:
+                count = self.random.randint(2, remaining)
+                children.append(self._container(count, depth - 1))
+            else:
+                count = 1
+                children.append(self._window())
+            remaining -= count
+        return children
+
+    def _container(self, windows, depth):
+        roll = self.random.random()
+        if roll < self.tabbed:
+            layout = 'tabbed'
+        elif roll < self.tabbed + self.stacked:
+            layout = 'stacked'
+        else:
+            layout = self.random.choice(['splith', 'splitv'])
+        con = self._con('con', None, layout=layout)
+        con['nodes'] = self._split(windows, depth)
+        con['focus'] = [child['id'] for child in con['nodes']]
+        return con
+
+    def _window(self):
+        window_properties = self.window_properties()
+        con = self._con('con', window_properties['title'])
+        con['window'] = next(self._window_ids)
+        con['window_properties'] = window_properties
+        con['title_format'] = ' %title '
+        con['border'] = 'pixel'
+        con['current_border_width'] = 2
+        return con
+
+    def _floating_con(self):
+        con = self._con('floating_con', None)
+        con['floating'] = 'user_on'
+        con['nodes'] = [self._window()]
+        con['focus'] = [con['nodes'][0]['id']]
+        return con
+
+    def _workspace(self, name, num):
+        ws = self._con('workspace', name)
+        ws['num'] = num
+        return ws
+
+    def _output(self, name, workspaces):
+        content = self._con('con', 'content')
+        content['nodes'] = workspaces
+        content['focus'] = [ws['id'] for ws in workspaces]
+        dock = self._con('dockarea', 'topdock')
+        output = self._con('output', name)
+        output['nodes'] = [dock, content]
+        output['focus'] = [content['id'], dock['id']]
+        return output
+
+    def _con(self, con_type, name, layout='splith'):
+        return {
+            'id': next(self._ids),
+            'type': con_type,
+            'orientation': 'none',
+            'scratchpad_state': 'none',
+            'percent': 0.5,
+            'urgent': False,
+            'focused': False,
+            'layout': layout,
+            'workspace_layout': 'default',
+            'last_split_layout': 'splith',
+            'border': 'normal',
+            'current_border_width': -1,
+            'rect': {'x': 0, 'y': 0, 'width': 1920, 'height': 1048},
+            'deco_rect': {'x': 0, 'y': 0, 'width': 0, 'height': 0},
+            'window_rect': {'x': 0, 'y': 0, 'width': 0, 'height': 0},
+            'geometry': {'x': 0, 'y': 0, 'width': 0, 'height': 0},
+            'name': name,
+            'window': None,
+            'nodes': [],
+            'floating_nodes': [],
+            'focus': [],
+            'fullscreen_mode': 0,
+            'sticky': False,
+            'floating': 'auto_off',
+            'swallows': [],
+        }
+
+
+def count_containers(container):
+    """
+    Count the containers in a tree, including the container itself.
+    """
+    count = 0
+    stack = [container]
+    while stack:
+        con = stack.pop()
+        count += 1
+        stack.extend(con.get('nodes', []))
+        stack.extend(con.get('floating_nodes', []))
+    return count
+
+
+def window_command_mappings(count, seed=0):
+    """
+    Build a list of window command mappings like a large config would have.
+    """
+    rng = random.Random(seed)
+    mappings = [
+        {'class': 'Alacritty', 'command': 'alacritty'},
+        {'class': 'Firefox', 'instance': 'Navigator', 'command': 'firefox'},
+        {'class': 'qutebrowser', 'command': 'qutebrowser'},
+    ]
+    for n in range(count - len(mappings)):
+        rule = {'class': f'App{n}', 'command': f'app{n} {{1}}'}
+        roll = rng.random()
+        if roll < 0.3:
+            rule['instance'] = f'app{n}'
+        elif roll < 0.4:
+            rule['title'] = f'App {n} main window'
+        elif roll < 0.5:
+            rule['window_role'] = 'browser'
+        mappings.append(rule)
+    return mappings
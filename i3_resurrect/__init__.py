@@ -1,8 +1,24 @@
-__all__ = ['config', 'layout', 'main', 'programs', 'treeutils', 'util']
+__all__ = ['apps', 'config', 'extractors', 'kakoune', 'launcher', 'layout',
+           'main', 'processes', 'programs', 'readiness', 'restorers',
+           'scheduler', 'session', 'storage', 'trace', 'treeutils', 'util',
+           'watch', 'xwindows']
 
+from . import apps
 from . import config
+from . import extractors
+from . import kakoune
+from . import launcher
 from . import layout
 from . import main
+from . import processes
 from . import programs
+from . import readiness
+from . import restorers
+from . import scheduler
+from . import session
+from . import storage
+from . import trace
 from . import treeutils
 from . import util
+from . import watch
+from . import xwindows
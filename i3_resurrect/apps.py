@@ -1,31 +1,32 @@
+import itertools
 import json
-import shlex
-import shutil
-import subprocess
+import os
 import sys
+import threading
+from collections import Counter
 from pathlib import Path
 
-import i3ipc
-import psutil
-import os
-import re
-import time
-
 from . import config
+from . import extractors
+from . import kakoune
+from . import launcher
+from . import readiness
+from . import restorers
+from . import session
+from . import trace
 from . import treeutils
 from . import util
 
+# The classes of the windows of the browser and the terminals.
+BROWSER_CLASS = 'qutebrowser'
+TERMINAL_CLASS = 'Alacritty'
 
 
 def read(workspace, directory, profile):
     """
     Read saved programs file.
     """
-    workspace_id = util.filename_filter(workspace)
-    filename = f'workspace_{workspace_id}_apps.json'
-    if profile is not None:
-        filename = f'{profile}_apps.json'
-    apps_file = Path(directory) / filename
+    apps_file = get_apps_file(workspace, directory, profile)
 
     apps = None
     try:
@@ -41,78 +42,257 @@ def read(workspace, directory, profile):
     return apps
 
 
-def restore(workspace, workspace_name, directory, profile):
+def get_apps_file(workspace, directory, profile):
+    """
+    Get the path of the saved apps file for a workspace or profile.
+    """
+    workspace_id = util.filename_filter(workspace)
+    filename = f'workspace_{workspace_id}_apps.json'
+    if profile is not None:
+        filename = f'{profile}_apps.json'
+    return Path(directory) / filename
+
+
+def restore(workspace, workspace_name, directory, profile, app_launcher,
+            watcher=None):
     """
     Restore the running programs from an i3 workspace.
+
+    Args:
+        workspace: The workspace id the programs were saved by.
+        workspace_name: The name of the workspace.
+        directory: The directory the programs were saved in.
+        profile: The profile the programs were saved to, if any.
+        app_launcher: The Launcher to launch programs with, which is shared by
+            every workspace being restored.
+        watcher: The started WindowWatcher of the restore, or None if windows
+            can't be watched for.
+
+    Returns the classes of the windows of the programs which were launched.
     """
     saved_apps = read(workspace, directory, profile)
 
     # Switch to a different workspace for loading all the apps so that they
     # don't get squished while loading on top of the pre-loaded layout
-    i3 = i3ipc.Connection()
+    i3 = session.get()
     i3.command(f'workspace "_load_{workspace_name}"')
+    i3.invalidate()
 
-    # We can assume that every workspace has its own browser profile that should
-    # be restored using the name of the workspace
-    subprocess.Popen([os.path.expanduser('~/.local/bin/qutebrowser-profile'),
-      '--load', workspace_name])
-    # We give it some time to restore so that its windows are hopefully open by
-    # the time we start restoring kakoune.  That should help getting things to
-    # restore in the relatively right places, hopefully!
-    # time.sleep(2.0)
+    # Only launch what isn't already running, so that restoring again after
+    # a partial failure doesn't open duplicates.
+    live_apps = get_live_apps(workspace_name)
+    missing_apps = get_missing_apps(saved_apps, live_apps)
+    return restore_apps(missing_apps, workspace_name, app_launcher, watcher)
+
+
+def restore_apps(saved_apps, workspace_name, app_launcher, watcher=None):
+    """
+    Launch the apps of a workspace which aren't running, as worked out by
+    get_missing_apps, by running the registered restorers.
+
+    If a started watcher is given, the restorers use it to wait for windows
+    to open.
+
+    Returns the classes of the windows of the apps which were launched.
+    """
+    context = restorers.Context(saved_apps, workspace_name, app_launcher,
+                                watcher)
 
     # Here are the details about where alacritty sockets are created...we're
     # following this to ensure that we participate in the global connectivity
     # between terminals (at least I think they use their name format to find
     # each other)
     # https://github.com/alacritty/alacritty/blob/master/alacritty/src/ipc.rs
-    first_terminal = True
     socket_path = os.path.expandvars(fr'/run/user/{os.getuid()}/Alacritty-$DISPLAY-{workspace_name}.sock')
-    
-    # Kakoune: First, clear any dead sessions
-    command = ['kak', '-clear']
-    os.spawnvp(os.P_NOWAIT, command[0], command)
-
-    # For some reason it seems we need to start the servers before adding clients
-    # and (or?) add a small wait in between to avoid a race condition
-    for session_name, s_entry in saved_apps.setdefault('kakoune_sessions', {}).items():
-        # Start a kakoune background server for this session
-        # in the server working directory
-        # Kakoune's system is interesting: all the clients for a given server
-        # use the server's working directory when they display the current file
-        # in the title bar.  Since we only have window titles to work with for
-        # resurrecting, we need to make sure we restore the proper server
-        # directory first before we attempt to restore the individual clients'
-        # files because those files will all be relative to that directory.
-        server_working_directory = os.path.expanduser(s_entry['server_working_directory'])
-        os.chdir(server_working_directory)
-        server_command = ['kak', '-s', session_name, '-d']
-        os.spawnvp(os.P_NOWAIT, server_command[0], server_command)
-        time.sleep(0.1)
-
-
-    for session_name, s_entry in saved_apps.setdefault('kakoune_sessions', {}).items():
-        server_working_directory = os.path.expanduser(s_entry['server_working_directory'])
-        # os.chdir(server_working_directory)
-
-        # Now fire up each client connecting to the same session
-        # in the same working directory
+    # New windows are opened in the workspace's terminal if it's still running.
+    running = saved_apps['alacritty_running'] and os.path.exists(socket_path)
+    context.state['terminals'] = Terminals(socket_path, running, app_launcher)
+
+    return restorers.run(context)
+
+
+def _launch_browser(context):
+    # We can assume that every workspace has its own browser profile that should
+    # be restored using the name of the workspace. It restores at the same time
+    # as everything else, since its windows are placed by their placeholders.
+    browser = context.launcher.start([
+        os.path.expanduser(config.get('browser_command',
+                                      '~/.local/bin/qutebrowser-profile')),
+        '--load',
+        context.workspace_name,
+    ], window_class=BROWSER_CLASS)
+    return browser is not None
+
+
+# Kakoune: Start a kakoune background server for each session in the
+# server working directory. Kakoune's system is interesting: all the
+# clients for a given server use the server's working directory when they
+# display the current file in the title bar.  Since we only have window
+# titles to work with for resurrecting, we need to make sure we restore the
+# proper server directory first before we attempt to restore the
+# individual clients' files because those files will all be relative to
+# that directory.
+def _launch_kakoune_servers(context):
+    kakoune_sessions = context.saved_apps.get('kakoune_sessions', {})
+    session_names = context.saved_apps.get('kakoune_servers', [])
+    kakoune.start_servers(
+        {
+            session_name: _server_working_directory(
+                kakoune_sessions[session_name])
+            for session_name in session_names
+        },
+        context.launcher,
+    )
+    return session_names != []
+
+
+def _launch_kakoune_clients(context):
+    # Fire up each client connecting to the same session in the same working
+    # directory. I've had issues with the machine just grinding to a halt if
+    # too many are open back-to-back, so the scheduler holds them back while
+    # the system is busy.
+    terminals = context.state['terminals']
+    kakoune_sessions = context.saved_apps.get('kakoune_sessions', {})
+    started = context.saved_apps.get('kakoune_servers', [])
+    # The servers which were already running are ready straight away, and
+    # the clients of each started server are opened as soon as it's ready.
+    running = [
+        session_name for session_name in kakoune_sessions
+        if session_name not in started
+    ]
+    launched = False
+    for session_name in itertools.chain(running,
+                                        wait_for_kakoune_sessions(started)):
+        s_entry = kakoune_sessions[session_name]
+        server_working_directory = _server_working_directory(s_entry)
         for client_name, c_entry in s_entry['clients'].items():
             path = os.path.expanduser(c_entry['path'])
             line = c_entry['line']
             column = c_entry['column']
-            first_terminal = run_terminal(first_terminal, socket_path, \
+            terminals.open(
               ['--working-directory', server_working_directory, '-e', 'sh', '-c', \
                fr'kak -c {session_name} "{path}" +{line}:{column} -e "rename-client {client_name}"'])
-            # I've had issues with the machine just grinding to a halt if too many
-            # are open back-to-back.  Let's try to fix that by delaying a little:
-            time.sleep(0.5)
+            launched = True
+    return launched
+
 
-    for a_entry in saved_apps.setdefault('alacritty', []):
+def _launch_alacritty(context):
+    terminals = context.state['terminals']
+    a_entries = context.saved_apps.get('alacritty', [])
+    for a_entry in a_entries:
         working_directory = os.path.expanduser(a_entry['path'])
-        # os.chdir(working_directory)
-        first_terminal = run_terminal(first_terminal, socket_path, \
-          ['--working-directory', working_directory])
+        terminals.open(['--working-directory', working_directory])
+    return a_entries != []
+
+
+def _server_working_directory(s_entry):
+    return os.path.expanduser(s_entry['server_working_directory'])
+
+
+def get_live_apps(workspace_name):
+    """
+    Get the state of the running apps which can be restored, from the titles
+    of their windows in the current layout tree and the list of running
+    Kakoune sessions.
+
+    Kakoune clients are looked for in every workspace because their names are
+    unique within their session, but terminals only count if they are in the
+    workspace or the workspace its apps are loaded in.
+
+    Returns:
+        A dict with the names of the running Kakoune sessions, the (session,
+        client) names of the running Kakoune clients and a Counter of the
+        working directories of the terminals.
+    """
+    workspace_apps = {}
+    other_apps = {}
+    for ws in treeutils.get_workspace_index().workspaces:
+        if ws['name'] in [workspace_name, f'_load_{workspace_name}']:
+            app_specific = workspace_apps
+        else:
+            app_specific = other_apps
+        for window in treeutils.get_leaves(ws):
+            extractors.extract(window['window_properties'], app_specific)
+
+    kakoune_clients = set()
+    for app_specific in [workspace_apps, other_apps]:
+        for session_name, s_entry in app_specific.get('kakoune_sessions',
+                                                      {}).items():
+            for client_name in s_entry['clients']:
+                kakoune_clients.add((session_name, client_name))
+
+    return {
+        'kakoune_sessions': kakoune.list_sessions(),
+        'kakoune_clients': kakoune_clients,
+        'alacritty': Counter(
+            a_entry['path'] for a_entry in workspace_apps.get('alacritty', [])
+        ),
+    }
+
+
+def get_missing_apps(saved_apps, live_apps):
+    """
+    Work out which of the saved apps aren't running.
+
+    Returns:
+        The saved apps with only the Kakoune clients and terminals which
+        aren't running, along with the names of the Kakoune sessions whose
+        servers need to be started as 'kakoune_servers' and whether the
+        workspace's terminal is running as 'alacritty_running'.
+    """
+    missing = {
+        'kakoune_sessions': {},
+        'kakoune_servers': [],
+        'alacritty': [],
+        'alacritty_running': sum(live_apps['alacritty'].values()) > 0,
+    }
+    skipped = 0
+    for session_name, s_entry in saved_apps.get('kakoune_sessions',
+                                                {}).items():
+        clients = {}
+        for client_name, c_entry in s_entry['clients'].items():
+            if (session_name, client_name) in live_apps['kakoune_clients']:
+                skipped += 1
+            else:
+                clients[client_name] = c_entry
+        server_running = session_name in live_apps['kakoune_sessions']
+        if not server_running:
+            missing['kakoune_servers'].append(session_name)
+        if clients != {} or not server_running:
+            missing['kakoune_sessions'][session_name] = dict(s_entry,
+                                                             clients=clients)
+
+    # Terminals can't be told apart beyond their working directories, so
+    # each running terminal stands in for one saved in the same directory.
+    running_terminals = Counter(live_apps['alacritty'])
+    for a_entry in saved_apps.get('alacritty', []):
+        if running_terminals[a_entry['path']] > 0:
+            running_terminals[a_entry['path']] -= 1
+            skipped += 1
+        else:
+            missing['alacritty'].append(a_entry)
+
+    if skipped > 0:
+        util.vprint(f'Skipping {skipped} apps which are already running')
+    return missing
+
+
+def wait_for_kakoune_sessions(session_names):
+    """
+    Generator which yields the names of Kakoune sessions as soon as their
+    servers are ready, followed by the sessions which didn't start in time.
+    """
+    timeout = config.get('kakoune_start_timeout', 10.0)
+    pending = dict.fromkeys(session_names)
+    for session_name in kakoune.iter_ready_sessions(session_names, timeout):
+        del pending[session_name]
+        trace.instant('kakoune ready', session=session_name)
+        yield session_name
+    for session_name in pending:
+        util.eprint(f'Kakoune session "{session_name}" did not start within '
+                    f'{timeout} seconds.')
+        # Start its clients anyway in case it's just slow.
+        yield session_name
 
 
 # Alacritty...
@@ -120,9 +300,9 @@ def restore(workspace, workspace_name, directory, profile):
 #    cut down on the instances by doing just one per workspace, and using its
 #    IPC support to open new windows in the same instance.
 #    https://github.com/alacritty/alacritty/issues/2735
-# 2. You must wait a small amount of time after opening the first terminal
-#    window before attempting any alacritty msg command or else it will
-#    say that the socket doesn't exist.
+# 2. You must wait for the socket to be created after opening the first
+#    terminal window before attempting any alacritty msg command or else it
+#    will say that the socket doesn't exist.
 # 3. Running the initial alacritty terminal should not be waited for but
 #    I prefer to wait for the msg commands to give the system a litle
 #    breathing room (though it doesn't seem necessary in my testing)
@@ -131,25 +311,80 @@ def restore(workspace, workspace_name, directory, profile):
 #    directory from the existing terminal, so if you don't want that you
 #    need to specify --working-directory <working_directory> as the first
 #    of the extra_args
-def run_terminal(first_terminal, socket_path, extra_args):
-  command = None
-  wait = None
+def run_terminal(first_terminal, socket_path, extra_args,
+                 app_launcher=None):
+  if app_launcher is None:
+    app_launcher = launcher.Launcher()
+
   if first_terminal:
-    command = ['alacritty', '--socket', socket_path] + extra_args
-    wait = os.P_NOWAIT
+    app_launcher.start(['alacritty', '--socket', socket_path] + extra_args,
+                       window_class=TERMINAL_CLASS)
+
+    # Wait for the socket to appear before attempting to connect to it or
+    # else the others won't be able to see the socket
+    timeout = config.get('alacritty_socket_timeout', 5.0)
+    with trace.span('wait for alacritty socket'):
+      missing = readiness.wait_for_paths([socket_path], timeout)
+    if missing:
+      util.eprint(f'Alacritty socket "{socket_path}" did not appear within '
+                  f'{timeout} seconds.')
   else:
     command = ['alacritty', 'msg', '--socket', socket_path, 'create-window'] + extra_args
-    wait = os.P_WAIT
-
-  # print(command)
-  os.spawnvp(wait, command[0], command)
-
-  if first_terminal:
-    # You must wait a little bit after opening the first terminal before
-    # attempting to connect to its socket or else the others
-    # won't be able to see the socket
-    time.sleep(0.1)
+    if app_launcher.run(command, window_class=TERMINAL_CLASS) != 0:
+      # The socket isn't usable, so open the window in its own instance
+      # rather than losing it
+      app_launcher.start(['alacritty'] + extra_args, admit=False)
 
   # Once we do the first terminal once it's not going to be any more
   return False
 
+
+class Terminals:
+    """
+    Opens terminal windows in the workspace's Alacritty instance, starting it
+    with the first window if it isn't running.
+
+    Windows can be opened from several threads at once. The first one starts
+    the instance while the others wait for its socket, and after that they
+    are all opened through the socket.
+    """
+
+    def __init__(self, socket_path, running, app_launcher):
+        self.socket_path = socket_path
+        self.app_launcher = app_launcher
+        self._running = running
+        self._lock = threading.Lock()
+
+    def open(self, extra_args):
+        """
+        Open a terminal window with extra arguments for Alacritty.
+        """
+        with self._lock:
+            if not self._running:
+                self._running = True
+                run_terminal(True, self.socket_path, extra_args,
+                             self.app_launcher)
+                return
+        run_terminal(False, self.socket_path, extra_args, self.app_launcher)
+
+
+restorers.register(restorers.Restorer(
+    'qutebrowser',
+    _launch_browser,
+    window_class=BROWSER_CLASS,
+))
+restorers.register(restorers.Restorer(
+    'kakoune_servers',
+    _launch_kakoune_servers,
+))
+restorers.register(restorers.Restorer(
+    'kakoune',
+    _launch_kakoune_clients,
+    requires=['kakoune_servers'],
+    window_class=TERMINAL_CLASS,
+))
+restorers.register(restorers.Restorer(
+    'alacritty',
+    _launch_alacritty,
+    window_class=TERMINAL_CLASS,
+))
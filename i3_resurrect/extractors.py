@@ -0,0 +1,142 @@
+"""
+Registry of extractors which capture app specific state from window titles.
+
+Each extractor has a precompiled title pattern and cheap prefilters, and they
+are indexed by window class so that for each window only the extractors which
+can apply to it are tried.
+"""
+import re
+
+from . import config
+
+
+class Extractor:
+    """
+    Captures app specific state from windows whose title matches a pattern.
+
+    Args:
+        name: The name of the extractor.
+        pattern: Regular expression which must match the whole title.
+        capture: Function called with the match object and the app specific
+            dict. It records the app's state and returns the swallow regex to
+            use for the title, or None to match the title literally.
+        classes: Window classes to try the extractor on, or a function which
+            returns them, such as from the config, or None for all.
+        instances: Window instances to try the extractor on, or None for all.
+        prefilter: Function called with the title before trying the pattern.
+            The pattern is only tried if it returns True.
+    """
+
+    def __init__(self, name, pattern, capture, classes=None, instances=None,
+                 prefilter=None):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.capture = capture
+        self.classes = classes
+        self.instances = None if instances is None else set(instances)
+        self.prefilter = prefilter
+
+    def get_classes(self):
+        """
+        Get the window classes to try the extractor on, or None for all.
+        """
+        if callable(self.classes):
+            return self.classes()
+        return self.classes
+
+
+def register(extractor):
+    """
+    Add an extractor to the registry.
+    """
+    global _by_class
+
+    _extractors.append(extractor)
+    # The index is built when it's first used, since the classes of some
+    # extractors come from the config.
+    _by_class = None
+
+
+def extract(window_properties, app_specific):
+    """
+    Capture app specific state from a window's title.
+
+    Returns the swallow regex for the title from the first extractor that
+    matches, or None if the title should be matched literally.
+    """
+    if _by_class is None:
+        _build_index()
+    title = window_properties.get('title', '')
+    window_class = window_properties.get('class', '')
+    instance = window_properties.get('instance', '')
+    for extractor in _by_class.get(window_class, _any_class):
+        if extractor.instances is not None \
+                and instance not in extractor.instances:
+            continue
+        if extractor.prefilter is not None and not extractor.prefilter(title):
+            continue
+        match = extractor.pattern.fullmatch(title)
+        if match:
+            return extractor.capture(match, app_specific)
+    return None
+
+
+def _build_index():
+    global _by_class
+    global _any_class
+
+    classes = {e: e.get_classes() for e in _extractors}
+    _any_class = [e for e in _extractors if classes[e] is None]
+    _by_class = {}
+    for window_class in {c for e in _extractors for c in classes[e] or []}:
+        _by_class[window_class] = [
+            e for e in _extractors
+            if classes[e] is None or window_class in classes[e]
+        ]
+
+
+def _capture_kakoune(match, app_specific):
+    file_path, line, column, client_name, session_name = match.groups()
+    app_specific\
+        .setdefault('kakoune_sessions', {})\
+        .setdefault(session_name, {})\
+        .setdefault('clients', {})\
+        [client_name] = {
+            'path': file_path,
+            'line': line,
+            'column': column
+        }
+    # Don't include the modified flag so that the window is swallowed by its
+    # placeholder even though the buffer won't be modified after restoring.
+    return (re.escape(file_path) + ' ' + line + ':' + column
+            + r'  \d+ sel(?:s)?(?: \(\d+\))? - ' + client_name + r'@\['
+            + session_name + r'\] - Kakoune')
+
+
+def _capture_alacritty(match, app_specific):
+    app_specific.setdefault('alacritty', []).append({
+        'path': match.group(3),
+    })
+    return None
+
+
+_extractors = []
+_by_class = None
+_any_class = []
+
+register(Extractor(
+    'kakoune',
+    r'(.+) (\d+):(\d+) (?:\[\+\])? \d+ sel(?:s)?(?: \(\d+\))? - (.+)@\[(.+)\]'
+    r' - Kakoune',
+    _capture_kakoune,
+    # Kakoune clients are restored in Alacritty.
+    classes=lambda: config.get('kakoune_classes', ['Alacritty']),
+    prefilter=lambda title: title.endswith(' - Kakoune'),
+))
+register(Extractor(
+    'alacritty',
+    r'(.+)@(.+):(.+)',
+    _capture_alacritty,
+    classes=lambda: config.get('terminals', ['Alacritty']),
+    prefilter=lambda title: '@' in title and ':' in title,
+))
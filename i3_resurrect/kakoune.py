@@ -0,0 +1,166 @@
+"""
+Helpers for talking to running Kakoune sessions.
+"""
+import os
+import pwd
+import shlex
+import subprocess
+import tempfile
+import time
+
+from . import readiness
+from . import util
+
+
+def get_working_directories(session_names, timeout):
+    """
+    Ask Kakoune sessions for their working directories.
+
+    All of the sessions are asked at once and their replies are waited for
+    together, so this takes about as long as the slowest session.
+
+    Args:
+        session_names: The names of the sessions to ask.
+        timeout: The maximum time in seconds to wait for the replies.
+
+    Returns:
+        A dict mapping the names of the sessions which replied in time to
+        their working directories.
+    """
+    deadline = time.monotonic() + timeout
+    working_directories = {}
+    with tempfile.TemporaryDirectory(prefix='i3-resurrect_',
+                                     dir=util.runtime_dir()) as tmp:
+        # Each session writes its working directory to its own file. The file
+        # is written under a temporary name and renamed so that it only
+        # appears once it is complete.
+        reply_files = {}
+        processes = {}
+        for index, session_name in enumerate(session_names):
+            reply_file = os.path.join(tmp, str(index))
+            partial = shlex.quote(reply_file + '.partial')
+            command = (f'echo %sh{{pwd > {partial} && '
+                       f'mv {partial} {shlex.quote(reply_file)}}}')
+            process = subprocess.Popen(
+                ['kak', '-p', session_name],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+            process.stdin.write(command)
+            process.stdin.close()
+            processes[session_name] = process
+            reply_files[session_name] = reply_file
+
+        for session_name, process in processes.items():
+            try:
+                returncode = process.wait(
+                    max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                returncode = None
+            if returncode != 0:
+                # The session is dead so it won't reply.
+                del reply_files[session_name]
+
+        readiness.wait_for_paths(reply_files.values(),
+                                 deadline - time.monotonic())
+
+        for session_name, reply_file in reply_files.items():
+            try:
+                with open(reply_file) as f:
+                    working_directories[session_name] = f.read().strip()
+            except FileNotFoundError:
+                pass
+
+    return working_directories
+
+
+def start_servers(working_directories, launcher):
+    """
+    Start a headless server for each Kakoune session, all at once without
+    waiting for any of them to be ready.
+
+    Args:
+        working_directories: A dict mapping the names of the sessions to the
+            directories to start their servers in.
+        launcher: The Launcher to start the servers with.
+    """
+    if working_directories == {}:
+        return
+    # Clear any dead sessions first, because a server can't take over the
+    # socket of a dead session with the same name.
+    launcher.run(['kak', '-clear'], admit=False, quiet=True)
+    for session_name, working_directory in working_directories.items():
+        if not os.path.isdir(working_directory):
+            util.eprint(f'Working directory "{working_directory}" of Kakoune '
+                        f'session "{session_name}" does not exist, starting '
+                        'it in the home directory.')
+            working_directory = os.path.expanduser('~')
+        # The servers don't open windows so they aren't held back.
+        launcher.start(
+            ['kak', '-s', session_name, '-d'],
+            cwd=working_directory,
+            admit=False,
+            quiet=True,
+        )
+
+
+def iter_ready_sessions(session_names, timeout):
+    """
+    Generator which yields the names of Kakoune sessions as soon as their
+    servers are accepting clients, which is when their sockets appear.
+
+    Sessions whose sockets don't appear before the timeout are looked for in
+    the list of running sessions, in case this version of Kakoune keeps its
+    sockets somewhere else, and are yielded last if they are running.
+
+    Args:
+        session_names: The names of the sessions to wait for.
+        timeout: The maximum time in seconds to wait for the sessions.
+    """
+    socket_dir = get_socket_dir()
+    pending = set(session_names)
+    for path in readiness.iter_paths(
+        [os.path.join(socket_dir, name) for name in session_names],
+        timeout,
+    ):
+        session_name = os.path.basename(path)
+        pending.discard(session_name)
+        yield session_name
+    if pending:
+        yield from sorted(pending & list_sessions())
+
+
+def get_socket_dir():
+    """
+    Get the directory Kakoune keeps the sockets of its sessions in.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'kakoune')
+    tmp_dir = os.environ.get('TMPDIR', '/tmp')
+    user = pwd.getpwuid(os.geteuid()).pw_name
+    return os.path.join(tmp_dir, f'kakoune-{user}')
+
+
+def list_sessions():
+    """
+    Get the names of the running Kakoune sessions.
+    """
+    try:
+        output = subprocess.run(
+            ['kak', '-l'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).stdout
+    except FileNotFoundError:
+        return set()
+    # Sessions whose servers have died are listed with a suffix.
+    return {
+        line for line in output.splitlines()
+        if line != '' and not line.endswith(' (dead)')
+    }
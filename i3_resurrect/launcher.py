@@ -0,0 +1,214 @@
+"""
+Launching of programs with their own working directory and environment.
+
+Nothing here changes the state of the i3-resurrect process itself, such as its
+working directory, so programs can be launched from several threads at once.
+"""
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import trace
+from . import util
+
+
+class Launch:
+    """
+    Record of a single launch.
+    """
+
+    def __init__(self, command, window_class=None):
+        self.command = command
+        # The class of the window the program opens, if it opens one.
+        self.window_class = window_class
+        # Whether the launch was admitted by the scheduler.
+        self.admitted = False
+        self.start = None
+        # Time in seconds the launch was held back by the scheduler.
+        self.held_back = 0.0
+        # Time in seconds it took to start the program, or for run() to
+        # finish.
+        self.duration = None
+        self.returncode = None
+        self.error = None
+
+
+class Launcher:
+    """
+    Launches programs, optionally admitting each one through a launch
+    scheduler, and times every launch.
+    """
+
+    def __init__(self, scheduler=None, max_workers=None):
+        """
+        Args:
+            scheduler: The LaunchScheduler which admits and wraps launches, if
+                any.
+            max_workers: The maximum number of launches submitted with
+                submit() which run at once. Defaults to the number of CPUs.
+        """
+        self.scheduler = scheduler
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.launches = []
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self, command, cwd=None, env=None, admit=True, quiet=False,
+              window_class=None):
+        """
+        Start a program without waiting for it to exit.
+
+        Args:
+            command: The command to run as a list of arguments.
+            cwd: The working directory to start the program in.
+            env: Environment variables to set for the program in addition to
+                those of this process.
+            admit: Whether the launch opens a window and so has to be admitted
+                by the scheduler.
+            quiet: Whether to discard the output of the program.
+            window_class: The class of the window the program opens, which
+                tells the scheduler when the launch is done.
+
+        Returns:
+            The Popen object of the program, or None if it couldn't be
+            started.
+        """
+        launch = self._begin(command, admit, window_class)
+        if self.scheduler is not None:
+            command = self.scheduler.wrap(command)
+        process = None
+        try:
+            process = subprocess.Popen(
+                command,
+                cwd=cwd,
+                env=_environment(env),
+                stdin=subprocess.DEVNULL,
+                **_output(quiet),
+            )
+        except OSError as e:
+            launch.error = str(e)
+            util.eprint(f'Could not launch {command[0]}: {e}')
+            self._release(launch)
+        self._end(launch)
+        return process
+
+    def run(self, command, cwd=None, env=None, admit=True, quiet=False,
+            window_class=None):
+        """
+        Run a program and wait for it to exit.
+
+        Takes the same arguments as start(), but the command isn't wrapped by
+        the scheduler since it isn't expected to keep running.
+
+        Returns:
+            The exit status of the program, or None if it couldn't be run.
+        """
+        launch = self._begin(command, admit, window_class)
+        try:
+            launch.returncode = subprocess.call(
+                command,
+                cwd=cwd,
+                env=_environment(env),
+                stdin=subprocess.DEVNULL,
+                **_output(quiet),
+            )
+        except OSError as e:
+            launch.error = str(e)
+            util.eprint(f'Could not run {command[0]}: {e}')
+            self._release(launch)
+        self._end(launch)
+        return launch.returncode
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Call a function in a background thread, for launching programs
+        concurrently.
+
+        Returns a Future for the result of the function.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers)
+            return self._executor.submit(func, *args, **kwargs)
+
+    def close(self):
+        """
+        Wait for the functions submitted with submit() to finish.
+        """
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown()
+
+    def report(self):
+        """
+        Print the timings of every launch.
+        """
+        with self._lock:
+            launches = list(self.launches)
+        for launch in launches:
+            command = ' '.join(launch.command)
+            if len(command) > 60:
+                command = command[:57] + '...'
+            message = f'Launched "{command}"'
+            if launch.error is not None:
+                message = f'Failed to launch "{command}"'
+            if launch.held_back > 0.001:
+                message += (f' after being held back for '
+                            f'{launch.held_back * 1000:.0f} ms')
+            util.vprint(f'{message} in {launch.duration * 1000:.1f} ms')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _begin(self, command, admit, window_class):
+        launch = Launch(command, window_class)
+        launch.admitted = admit and self.scheduler is not None
+        if launch.admitted:
+            with trace.span('admit', 'launch', command=command):
+                launch.held_back = self.scheduler.admit(launch)
+        launch.start = time.perf_counter()
+        return launch
+
+    def _release(self, launch):
+        # A launch which failed won't open a window, so it mustn't hold back
+        # the others.
+        if launch.admitted:
+            self.scheduler.release(launch)
+
+    def _end(self, launch):
+        end = time.perf_counter()
+        launch.duration = end - launch.start
+        trace.complete(_trace_name(launch.command), launch.start, end,
+                       'launch', command=launch.command,
+                       held_back=launch.held_back,
+                       returncode=launch.returncode, error=launch.error)
+        with self._lock:
+            self.launches.append(launch)
+
+
+def _trace_name(command):
+    # Name launches by the program and its subcommand or first option, such as
+    # "kak -s" or "alacritty msg".
+    name = os.path.basename(command[0])
+    if len(command) > 1:
+        name += f' {command[1]}'
+    return name
+
+
+def _output(quiet):
+    if quiet:
+        return {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    return {}
+
+
+def _environment(env):
+    if env is None:
+        return None
+    return {**os.environ, **env}
@@ -1,22 +1,30 @@
-from asyncio.subprocess import PIPE
+import hashlib
 import json
-import shlex
-import subprocess
 import sys
 import tempfile
+import time
 from pathlib import Path
-import tempfile
-import os
-
-import i3ipc
 
+from . import config
+from . import kakoune
+from . import session
+from . import storage
+from . import trace
 from . import treeutils
 from . import util
+from . import xwindows
 
 
-def save(workspace, numeric, directory, profile, swallow_criteria):
+def save(workspace, numeric, directory, profile, swallow_criteria,
+         workspace_tree=None, force=False):
     """
     Save an i3 workspace layout to a file.
+
+    If the workspace tree has already been looked up it can be passed in as
+    workspace_tree, otherwise it is looked up by name or number.
+
+    Nothing is written if the workspace hasn't changed since it was last saved
+    unless force is True. Returns whether the files were written.
     """
     workspace_id = util.filename_filter(workspace)
     filename = f'workspace_{workspace_id}_layout.json'
@@ -27,55 +35,66 @@ def save(workspace, numeric, directory, profile, swallow_criteria):
     app_filename = f'workspace_{workspace_id}_apps.json'
     app_file = Path(directory) / app_filename
 
-    workspace_tree = treeutils.get_workspace_tree(workspace, numeric)
+    if workspace_tree is None:
+        workspace_tree = treeutils.get_workspace_tree(workspace, numeric)
 
     # Build new workspace tree suitable for restoring and write it to a
     # file.
     app_specific = {}
     tree = build_layout(workspace_tree, swallow_criteria, app_specific)
 
-    # Find out the cwd of each session so we can restore that properly
-    #tmpfile = subprocess.check_output(['mktemp'], text=True).strip()
-    for session_name, s_entry in app_specific.setdefault('kakoune_sessions', {}).items():
-        with tempfile.NamedTemporaryFile('w+') as tf:
-            # echo "echo %sh{pwd > tmpfile}" | kak -p 78177
-            input = r'echo %sh{pwd > ' + tf.name + r'}'
-            subprocess.run(['kak', '-p', session_name], 
-                input=input, check=True, text=True)
-            # Wait for the async process to write to the file
-            # (yes I know something like pyinotify would be better here
-            #  but I couldn't figure out how to install it... :=O)
-            while os.path.getsize(tf.name) == 0:
-                pass
-            server_cwd = tf.read().strip()
-            # print(server_cwd)
-            s_entry['server_working_directory'] = server_cwd
-            
-        # print(input, flush=True)
-        # p = subprocess.Popen(['kak', '-p', session_name], text=True, stdin=PIPE)
-        # p.stdin.write(input + "\n")
-        # p.stdin.close()
-        # # p.communicate(input=input)
-        # if p.wait() != 0:
-        #     util.eprint("Asking kak for the cwd failed")
-        #     sys.exit(1)
-        # with open('/home/bob-k/data') as f:
-        #     server_cwd = f.read()
-        #     print(server_cwd)
-        #     s_entry['server_working_directory'] = server_cwd
-
-
-    with layout_file.open('w') as f:
-        f.write(json.dumps(tree, indent=2))
-
-    # print(app_specific, flush=True)
-    with app_file.open('w') as f:
-        f.write(json.dumps(app_specific, indent=2))
-
-
-def read(workspace, directory, profile):
+    # Skip writing the files and probing apps for their state if nothing has
+    # changed since the last save, including how the files are written.
+    compact = config.get('compact_layouts', False)
+    fingerprint = calc_fingerprint(tree, app_specific, {'compact': compact})
+    fingerprint_file = get_fingerprint_file(layout_file)
+    if (not force
+            and layout_file.is_file()
+            and app_file.is_file()
+            and read_fingerprint(fingerprint_file) == fingerprint):
+        return False
+
+    # Find out the cwd of each session so we can restore that properly.
+    kakoune_sessions = app_specific.setdefault('kakoune_sessions', {})
+    if kakoune_sessions != {}:
+        timeout = config.get('kakoune_timeout', 2.0)
+        working_directories = kakoune.get_working_directories(
+            list(kakoune_sessions),
+            timeout,
+        )
+        for session_name, s_entry in kakoune_sessions.items():
+            if session_name not in working_directories:
+                util.eprint(f'Kakoune session "{session_name}" did not reply '
+                            f'within {timeout} seconds, its working directory '
+                            'will be restored as the home directory.')
+            s_entry['server_working_directory'] = working_directories.get(
+                session_name,
+                '~',
+            )
+
+    storage.write_json(layout_file, tree, compact)
+
+    # Also save the part of the layout that is passed to append_layout, so
+    # that it's ready to use when restoring. It's only read by i3 so it's
+    # always compact, which also makes it quicker for i3 to parse.
+    storage.write_json(
+        get_payload_file(layout_file),
+        get_payload_nodes(tree),
+        compact=True,
+    )
+
+    storage.write_json(app_file, app_specific, compact)
+
+    fingerprint_file.write_text(fingerprint)
+    return True
+
+
+def read(workspace, directory, profile, required=True):
     """
     Read saved layout file.
+
+    If required is False, None is returned instead of exiting when the file
+    is missing, and also when it can't be read.
     """
     workspace_id = util.filename_filter(workspace)
     filename = f'workspace_{workspace_id}_layout.json'
@@ -92,16 +111,49 @@ def read(workspace, directory, profile):
         else:
             util.eprint('Could not find saved layout for workspace '
                         f'"{workspace}"')
-        sys.exit(1)
+        if required:
+            sys.exit(1)
+    except (OSError, ValueError) as e:
+        if required:
+            raise
+        util.eprint(f'Could not read saved layout "{layout_file}": {e}')
     return layout
 
 
-def restore(workspace_name, layout):
+def read_payload(workspace, directory, profile):
+    """
+    Get the path of the append_layout payload saved along with a layout.
+
+    Returns None if there is no payload or the layout file has been modified
+    since it was written.
+    """
+    workspace_id = util.filename_filter(workspace)
+    filename = f'workspace_{workspace_id}_layout.json'
+    if profile is not None:
+        filename = f'{profile}_layout.json'
+    layout_file = Path(directory) / filename
+    payload_file = get_payload_file(layout_file)
+
+    try:
+        if payload_file.stat().st_mtime < layout_file.stat().st_mtime:
+            return None
+    except FileNotFoundError:
+        return None
+    return payload_file
+
+
+def restore(workspace_name, layout, payload_file=None):
     """
     Restore an i3 workspace layout.
+
+    If payload_file is given it is passed to append_layout as is, otherwise
+    the payload is built from the layout.
+
+    Returns the ids of the windows which were remapped, which i3 reports as
+    new windows.
     """
     if layout == {}:
-        return
+        return []
     window_ids = []
     placeholder_window_ids = []
 
@@ -118,44 +170,57 @@ def restore(workspace_name, layout):
             # Otherwise, add it to the list of regular windows.
             window_ids.append(window_id)
 
+    window_ops = xwindows.WindowOps()
+    start = time.perf_counter()
+
     # Unmap all non-placeholder windows in workspace.
-    for window_id in window_ids:
-        xdo_unmap_window(window_id)
+    with trace.span('unmap', windows=len(window_ids)):
+        window_ops.unmap(window_ids)
 
     # Remove any remaining placeholder windows in workspace so that we don't
     # have duplicates.
-    for window_id in placeholder_window_ids:
-        xdo_kill_window(window_id)
+    with trace.span('kill placeholders', windows=len(placeholder_window_ids)):
+        window_ops.kill(placeholder_window_ids)
 
-    try:
-        i3 = i3ipc.Connection()
+    unmap_time = time.perf_counter() - start
+
+    i3 = session.get()
+    # Unmapped and killed windows are no longer part of the tree.
+    if window_ids != [] or placeholder_window_ids != []:
+        i3.invalidate()
 
+    try:
         # append_layout can only insert nodes so we must separately change the
-        # layout mode of the workspace node.
+        # layout mode of the workspace node. The workspace is already focused
+        # so we only need to look it up again if it wasn't found before.
         ws_layout_mode = layout.get('layout', 'default')
-        tree = i3.get_tree()
-        focused = tree.find_focused()
-        workspace_node = focused.workspace()
-        workspace_node.command(f'layout {ws_layout_mode}')
+        if ws == {}:
+            ws = treeutils.get_focused_workspace()
 
         # We don't want to pass the whole layout file because we don't want to
-        # append a new workspace. append_layout requires a file path so we must
-        # extract the part of the json that we want and store it in a tempfile.
-        restorable_layout = (
-            layout.get('nodes', []) + layout.get('floating_nodes', []),
-        )
-        restorable_layout_file = tempfile.NamedTemporaryFile(
-            mode='w',
-            prefix='i3-resurrect_',
-        )
-        restorable_layout_file.write(json.dumps(restorable_layout))
-        restorable_layout_file.flush()
-
-        # Create fresh placeholder windows by appending layout to workspace.
-        i3.command(f'append_layout {restorable_layout_file.name}')
+        # append a new workspace. If the payload wasn't saved with the layout
+        # we must build it from the layout.
+        restorable_layout_file = None
+        if payload_file is None:
+            with trace.span('build payload'):
+                restorable_layout_file = write_temp_payload(layout)
+            payload_file = restorable_layout_file.name
+
+        # Create fresh placeholder windows by appending layout to workspace,
+        # in the same message as the layout command.
+        with trace.span('append_layout', workspace=workspace_name,
+                        layout=ws_layout_mode):
+            with i3.batch() as batch:
+                batch.add(f'[con_id="{ws["id"]}"] layout {ws_layout_mode}')
+                batch.add(f'append_layout {util.quote(str(payload_file))}')
 
         # Delete tempfile.
-        restorable_layout_file.close()
+        if restorable_layout_file is not None:
+            restorable_layout_file.close()
+
+        errors = batch.errors()
+        if errors != []:
+            raise RuntimeError(errors[0][1])
     except Exception as e:
         util.eprint('Error occurred restoring workspace layout. Note that if '
                     'the layout was saved by a version prior to 1.4.0 it must '
@@ -164,51 +229,162 @@ def restore(workspace_name, layout):
     finally:
         # Map all unmapped windows. We use finally because we don't want the
         # user to lose their windows no matter what.
-        for window_id in window_ids:
-            xdo_map_window(window_id)
+        start = time.perf_counter()
+        with trace.span('remap', windows=len(window_ids)):
+            window_ops.map(window_ids)
+        map_time = time.perf_counter() - start
+        util.vprint(f'Window operations ({window_ops.backend}): unmapped '
+                    f'{len(window_ids)} and killed '
+                    f'{len(placeholder_window_ids)} in '
+                    f'{unmap_time * 1000:.1f} ms, remapped in '
+                    f'{map_time * 1000:.1f} ms')
+        window_ops.close()
+    return window_ids
+
+
+def restore_commands(workspace_name, layout, payload_file):
+    """
+    Build the commands which restore a layout to a workspace that doesn't
+    exist yet.
+
+    There are no windows to unmap or placeholders to remove in a new
+    workspace, and the workspace is focused as soon as it is created, so the
+    commands can be sent to i3 in one go together with those for other
+    workspaces without looking at the tree in between.
+    """
+    ws_layout_mode = layout.get('layout', 'default')
+    return [
+        f'workspace --no-auto-back-and-forth {util.quote(workspace_name)}',
+        f'layout {ws_layout_mode}',
+        f'append_layout {util.quote(str(payload_file))}',
+    ]
+
+
+def write_temp_payload(layout):
+    """
+    Write the append_layout payload for a layout to a tempfile, which is kept
+    on tmpfs if possible. append_layout requires a file path so the payload
+    can't be passed to i3 directly.
+
+    The tempfile is deleted when it is closed.
+    """
+    payload_file = tempfile.NamedTemporaryFile(
+        mode='w',
+        prefix='i3-resurrect_',
+        dir=util.runtime_dir(),
+    )
+    payload_file.write(build_payload(layout))
+    payload_file.flush()
+    return payload_file
 
 
-def build_layout(tree, swallow, app_specific):
+def get_saved_workspaces(directory):
+    """
+    Get the workspaces with a layout saved in a directory.
+
+    Returns:
+        (workspace_id, workspace_name) tuples. The workspace id is taken from
+        the name of the layout file and is what the workspace's files are
+        read by, which isn't the workspace's name if it was saved by number
+        or its name has characters which can't be used in filenames. The
+        name is the one saved in the layout.
+    """
+    workspaces = []
+    for layout_file in Path(directory).glob('workspace_*_layout.json'):
+        workspace_id = layout_file.name[len('workspace_'):-len('_layout.json')]
+        try:
+            saved_layout = json.loads(layout_file.read_text())
+        except (OSError, ValueError):
+            continue
+        workspaces.append(
+            (workspace_id, saved_layout.get('name', workspace_id)))
+    return workspaces
+
+
+def build_layout(tree, swallow, app_specific=None):
     """
     Builds a restorable layout tree with basic Python data structures which are
     JSON serialisable.
+
+    App specific state captured from the windows is added to app_specific if
+    it is given.
     """
     processed = treeutils.process_node(tree, swallow, app_specific)
     return processed
 
 
-def is_placeholder(container):
+def build_payload(layout):
     """
-    Check if a container is a placeholder window.
+    Builds the JSON passed to append_layout to restore a layout, which
+    contains the workspace's children but not the workspace itself.
+    """
+    return ''.join(storage.iterencode_compact(get_payload_nodes(layout)))
 
-    Args:
-        container: The container to check.
+
+def get_payload_nodes(layout):
     """
-    return container['swallows'] not in [[], None]
+    Get the part of a layout which is passed to append_layout.
+    """
+    return (layout.get('nodes', []) + layout.get('floating_nodes', []),)
 
 
-def xdo_unmap_window(window_id):
-    command = shlex.split(f'xdotool windowunmap {window_id}')
-    subprocess.call(
-        command,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-    )
+def get_payload_file(layout_file):
+    """
+    Get the path of the append_layout payload saved along with a layout file.
+    """
+    return layout_file.with_name(f'.{layout_file.name}.append')
 
 
-def xdo_map_window(window_id):
-    command = shlex.split(f'xdotool windowmap {window_id}')
-    subprocess.call(
-        command,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-    )
+def get_fingerprint_file(layout_file):
+    """
+    Get the path of the fingerprint saved along with a layout file.
+    """
+    return layout_file.with_name(f'.{layout_file.name}.sha256')
 
 
-def xdo_kill_window(window_id):
-    command = shlex.split(f'xdotool windowkill {window_id}')
-    subprocess.call(
-        command,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
+def calc_fingerprint(tree, app_specific, options=None):
+    """
+    Calculate a fingerprint of a processed layout tree and the app specific
+    state captured from it, used to detect whether a workspace has changed.
+
+    The options the files are written with are included, so that the files
+    are written again when they change.
+    """
+    normalised = json.dumps(
+        [tree, app_specific, options or {}],
+        sort_keys=True,
+        separators=(',', ':'),
     )
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+def read_fingerprint(fingerprint_file):
+    """
+    Read the fingerprint stored by the last save, if there is one.
+    """
+    try:
+        return fingerprint_file.read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+def get_placeholders(workspace_name):
+    """
+    Get the placeholders in a workspace which are waiting for a window to
+    swallow.
+    """
+    ws = treeutils.get_workspace_tree(workspace_name, False)
+    return [
+        node for _, _, node in treeutils.walk(ws)
+        if node.get('swallows') and node.get('window') is None
+    ]
+
+
+def is_placeholder(container):
+    """
+    Check if a container is a placeholder window.
+
+    Args:
+        container: The container to check.
+    """
+    return container['swallows'] not in [[], None]
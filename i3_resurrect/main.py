@@ -1,15 +1,20 @@
 import sys
+import time
 from pathlib import Path
 
 import click
-import i3ipc
 from natsort import natsorted
 
 from . import config
 from . import layout
 from . import apps
+from . import launcher
+from . import scheduler
+from . import session
+from . import trace
 from . import util
 from . import treeutils
+from . import watch
 
 DEFAULT_DIRECTORY = config.get('directory', '~/.i3/i3-resurrect/')
 
@@ -17,13 +22,19 @@ DEFAULT_DIRECTORY = config.get('directory', '~/.i3/i3-resurrect/')
 @click.group(context_settings=dict(help_option_names=['-h', '--help'],
                                    max_content_width=150))
 @click.version_option()
-def main():
-    pass
+@click.option('--verbose', '-v',
+              is_flag=True,
+              help='Print timings and other details to stderr.')
+def main(verbose):
+    util.verbose = verbose
 
 
 @main.command('save')
 @click.option('--workspace', '-w',
               help='The workspace to save.\n[default: current workspace]')
+@click.option('--all', '-a', 'save_all',
+              is_flag=True,
+              help='Save every workspace.')
 @click.option('--numeric', '-n',
               is_flag=True,
               help='Select workspace by number instead of name.')
@@ -46,32 +57,74 @@ def main():
 @click.option('--programs-only', 'target',
               flag_value='programs_only',
               help='Only save running programs.')
-def save_workspace(workspace, numeric, directory, profile, swallow, target):
+@click.option('--force', '-f',
+              is_flag=True,
+              help='Save even if the workspace is unchanged since last save.')
+def save_workspace(workspace, save_all, numeric, directory, profile, swallow,
+                   target, force):
     """
     Save an i3 workspace's layout and running programs to a file.
     """
-    if workspace is None:
-        i3 = i3ipc.Connection()
-        workspace = i3.get_tree().find_focused().workspace().name
+    if save_all and (workspace is not None or profile is not None):
+        util.eprint('--all cannot be used with --workspace or --profile.')
+        sys.exit(1)
+
+    if workspace is None and not save_all:
+        workspace = treeutils.get_focused_workspace()['name']
 
     directory = util.resolve_directory(directory, profile)
 
     # Create directory if non-existent.
     Path(directory).mkdir(parents=True, exist_ok=True)
 
+    if save_all:
+        save_all_workspaces(directory, swallow, target, force)
+        return
+
     if target != 'programs_only':
         # Save workspace layout to file.
         swallow_criteria = swallow.split(',')
-        layout.save(workspace, numeric, directory, profile, swallow_criteria)
+        saved = layout.save(workspace, numeric, directory, profile,
+                            swallow_criteria, force=force)
+        if not saved:
+            print(f'Workspace "{workspace}" is unchanged since the last save, '
+                  'skipping.')
 
     # if target != 'layout_only':
     #     # Save running programs to file.
     #     programs.save(workspace, numeric, directory, profile)
 
 
+def save_all_workspaces(directory, swallow, target, force):
+    """
+    Save every workspace from a single snapshot of the layout tree.
+    """
+    swallow_criteria = swallow.split(',')
+    total_start = time.perf_counter()
+    workspaces = treeutils.get_workspaces()
+    for workspace_tree in workspaces:
+        workspace = workspace_tree['name']
+        start = time.perf_counter()
+        saved = True
+        if target != 'programs_only':
+            saved = layout.save(workspace, False, directory, None,
+                                swallow_criteria, workspace_tree, force)
+        elapsed = (time.perf_counter() - start) * 1000
+        if saved:
+            print(f'Saved workspace "{workspace}" in {elapsed:.1f} ms')
+        else:
+            print(f'Workspace "{workspace}" is unchanged, checked in '
+                  f'{elapsed:.1f} ms')
+    total = (time.perf_counter() - total_start) * 1000
+    print(f'Saved {len(workspaces)} workspaces in {total:.1f} ms')
+
+
 @main.command('restore')
 @click.option('--workspace', '-w',
               help='The workspace to restore.\n[default: current workspace]')
+@click.option('--all', '-a', 'restore_all',
+              is_flag=True,
+              help='Restore every saved workspace.')
 @click.option('--numeric', '-n',
               is_flag=True,
               help='Select workspace by number instead of name.')
@@ -89,38 +142,289 @@ def save_workspace(workspace, numeric, directory, profile, swallow, target):
 @click.option('--programs-only', 'target',
               flag_value='programs_only',
               help='Only restore running programs.')
-def restore_workspace(workspace, numeric, directory, profile, target):
+@click.option('--swallow-timeout', '-t',
+              type=float,
+              default=None,
+              help=('Seconds to wait for programs\' windows to be swallowed '
+                    'by their placeholders.\n[default: 10]'))
+@click.option('--trace', 'trace_file',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=('Write a timeline of the restore to a file in the Chrome '
+                    'trace format, for viewing in Perfetto.'))
+def restore_workspace(workspace, restore_all, numeric, directory, profile,
+                      target, swallow_timeout, trace_file):
     """
     Restore i3 workspace layout and programs.
     """
-    i3 = i3ipc.Connection()
+    if restore_all and (workspace is not None or profile is not None):
+        util.eprint('--all cannot be used with --workspace or --profile.')
+        sys.exit(1)
 
-    if workspace is None:
-        workspace = i3.get_tree().find_focused().workspace().name
+    if workspace is None and not restore_all:
+        workspace = treeutils.get_focused_workspace()['name']
 
     directory = util.resolve_directory(directory, profile)
 
-    if numeric and not workspace.isdigit():
+    if numeric and not restore_all and not workspace.isdigit():
         util.eprint('Invalid workspace number.')
         sys.exit(1)
 
+    if swallow_timeout is None:
+        swallow_timeout = config.get('swallow_timeout', 10.0)
+
+    if trace_file is not None:
+        trace.enable()
+
+    # One window watcher and launch scheduler are shared by every workspace
+    # being restored. Launches are admitted by the scheduler according to how
+    # busy the system is, and it counts the windows which open to know how
+    # many launches are still pending. The tracker watches for programs'
+    # windows being swallowed by the placeholders.
+    tracker = None
+    watcher = None
+    launch_scheduler = scheduler.LaunchScheduler.from_config()
+    app_launcher = launcher.Launcher(launch_scheduler)
+    if target != 'layout_only':
+        watcher = watch.WindowWatcher()
+        watcher.add_handler(launch_scheduler.window_opened)
+        if swallow_timeout > 0:
+            tracker = watch.SwallowTracker()
+            watcher.add_handler(tracker.window_opened)
+        if not watcher.start():
+            watcher.stop()
+            watcher = None
+            tracker = None
+        launch_scheduler.count_pending = watcher is not None
+
+    try:
+        if restore_all:
+            restore_all_workspaces(directory, target, app_launcher, watcher,
+                                   tracker)
+        else:
+            restore_single_workspace(workspace, directory, profile, target,
+                                     app_launcher, watcher, tracker)
+        app_launcher.close()
+        app_launcher.report()
+        if tracker is not None:
+            start = time.perf_counter()
+            with trace.span('wait for swallows'):
+                tracker.wait(swallow_timeout)
+            elapsed = (time.perf_counter() - start) * 1000
+            util.vprint(f'Waited {elapsed:.0f} ms for windows to be swallowed')
+            tracker.report()
+    finally:
+        app_launcher.close()
+        if watcher is not None:
+            watcher.stop()
+        if trace_file is not None:
+            trace.write(trace_file)
+            util.vprint(f'Wrote trace to "{trace_file}"')
+
+
+def restore_single_workspace(workspace, directory, profile, target,
+                             app_launcher=None, watcher=None, tracker=None,
+                             required=True):
+    """
+    Restore the layout and programs of a single workspace.
+
+    Programs are launched with the given launcher, which must be given unless
+    only the layout is restored, and the started window watcher, if any.
+
+    If a swallow tracker is given, the workspace's placeholders are added to
+    it before the programs are launched, and those whose programs weren't
+    launched are discarded again afterwards.
+
+    If required is False, a workspace whose layout can't be read is skipped
+    instead of exiting. Returns whether the workspace was restored.
+    """
+    i3 = session.get()
+
     # Get layout name from file.
-    workspace_layout = layout.read(workspace, directory, profile)
+    with trace.span('read layout', workspace=workspace):
+        workspace_layout = layout.read(workspace, directory, profile,
+                                       required)
+        payload_file = layout.read_payload(workspace, directory, profile)
+    if workspace_layout is None:
+        return False
     if 'name' in workspace_layout and profile is None:
         workspace_name = workspace_layout['name']
     else:
         workspace_name = workspace
 
-    # Switch to the workspace which we are loading.
-    i3.command(f'workspace --no-auto-back-and-forth "{workspace_name}"')
+    # Switch to the workspace which we are loading. This can create the
+    # workspace or remove the previously focused one, so the tree snapshot is
+    # no longer valid.
+    with trace.span('switch workspace', workspace=workspace_name):
+        i3.command(f'workspace --no-auto-back-and-forth "{workspace_name}"')
+    i3.invalidate()
 
     if target != 'programs_only':
         # Load workspace layout.
-        layout.restore(workspace_name, workspace_layout)
+        with trace.span('restore layout', workspace=workspace_name):
+            remapped = layout.restore(workspace_name, workspace_layout,
+                                      payload_file)
+        if tracker is not None:
+            tracker.ignore(remapped)
 
     if target != 'layout_only':
+        placeholders = []
+        if tracker is not None:
+            i3.invalidate()
+            placeholders = layout.get_placeholders(workspace_name)
+            tracker.add(placeholders)
         # Restore programs.
-        apps.restore(workspace, workspace_name, directory, profile)
+        with trace.span('restore programs', workspace=workspace_name):
+            window_classes = apps.restore(workspace, workspace_name,
+                                          directory, profile, app_launcher,
+                                          watcher)
+        if tracker is not None:
+            tracker.discard(watch.get_unlaunched(placeholders,
+                                                 window_classes))
+    return True
+
+
+def restore_all_workspaces(directory, target, app_launcher=None,
+                           watcher=None, tracker=None):
+    """
+    Restore every saved workspace over a single i3 connection.
+
+    The focused workspace, or else the most recently used one, is restored
+    first along with its programs so that it's usable as soon as possible.
+    The layouts of the other workspaces are then restored, with those that
+    don't exist yet restored by a batch of i3 commands, and finally their
+    programs are launched with the given launcher and window watcher, as by
+    restore_single_workspace.
+    """
+    total_start = time.perf_counter()
+    i3 = session.get()
+
+    # Workspaces are identified by their names in i3 but their files are
+    # read by the workspace ids in their filenames.
+    existing = [ws['name'] for ws in treeutils.get_workspaces_by_focus()]
+    focus_rank = {name: rank for rank, name in enumerate(existing)}
+    workspaces = sorted(
+        natsorted(layout.get_saved_workspaces(directory),
+                  key=lambda workspace: workspace[1]),
+        key=lambda workspace: focus_rank.get(workspace[1], len(focus_rank)),
+    )
+    if workspaces == []:
+        util.eprint(f'Could not find any saved workspaces in "{directory}"')
+        sys.exit(1)
+
+    # A workspace whose files can't be read is skipped rather than stopping
+    # the others from being restored.
+    skipped = set()
+    (front_id, front), rest = workspaces[0], workspaces[1:]
+    front_target = target
+    if not apps.get_apps_file(front_id, directory, None).is_file():
+        front_target = 'layout_only'
+    if not (target == 'programs_only' and front_target == 'layout_only'):
+        if not restore_single_workspace(front_id, directory, None,
+                                        front_target, app_launcher, watcher,
+                                        tracker, required=False):
+            skipped.add(front_id)
+    elapsed = (time.perf_counter() - total_start) * 1000
+    if front_id not in skipped:
+        print(f'Restored workspace "{front}" in {elapsed:.1f} ms')
+
+    if target != 'programs_only':
+        temp_payloads = []
+        restored_layouts = 0
+        with trace.span('append_layout'):
+            with i3.batch() as batch:
+                for workspace_id, workspace in rest:
+                    if restore_layout(workspace_id, workspace, directory,
+                                      focus_rank, batch, temp_payloads,
+                                      tracker):
+                        restored_layouts += 1
+                    else:
+                        skipped.add(workspace_id)
+        i3.invalidate()
+        for command, error in batch.errors():
+            util.eprint(f'Error restoring workspace layouts: {error}\n'
+                        f'  {command}')
+        for temp_payload in temp_payloads:
+            temp_payload.close()
+        elapsed = (time.perf_counter() - total_start) * 1000
+        print(f'Restored {restored_layouts} more layouts, {elapsed:.1f} ms in '
+              'total')
+
+    if target != 'layout_only':
+        rest = [
+            (workspace_id, workspace) for workspace_id, workspace in rest
+            if workspace_id not in skipped
+            and apps.get_apps_file(workspace_id, directory, None).is_file()
+        ]
+        placeholders = {}
+        if tracker is not None:
+            i3.invalidate()
+            for _, workspace in rest:
+                placeholders[workspace] = layout.get_placeholders(workspace)
+                tracker.add(placeholders[workspace])
+        for workspace_id, workspace in rest:
+            with trace.span('restore programs', workspace=workspace):
+                window_classes = apps.restore(workspace_id, workspace,
+                                              directory, None, app_launcher,
+                                              watcher)
+            if tracker is not None:
+                tracker.discard(watch.get_unlaunched(placeholders[workspace],
+                                                     window_classes))
+
+    # Go back to the workspace which was restored first.
+    if front_id not in skipped:
+        i3.command(f'workspace --no-auto-back-and-forth {util.quote(front)}')
+        i3.invalidate()
+    total = (time.perf_counter() - total_start) * 1000
+    restored = len(workspaces) - len(skipped)
+    print(f'Restored {restored} workspaces in {total:.1f} ms')
+    if skipped:
+        util.eprint(f'Skipped {len(skipped)} workspaces which could not be '
+                    'read')
+
+
+def restore_layout(workspace_id, workspace, directory, existing, batch,
+                   temp_payloads, tracker=None):
+    """
+    Restore the layout of one of the workspaces restored by
+    restore_all_workspaces, reading its files by its workspace id.
+
+    Workspaces which don't exist yet are restored by adding their commands to
+    the batch. The temporary payload files created for them are added to
+    temp_payloads, and must be kept until the batch has been sent. The
+    windows remapped in existing workspaces are ignored by the swallow
+    tracker, if one is given.
+
+    Returns whether the layout could be read.
+    """
+    i3 = session.get()
+    with trace.span('read layout', workspace=workspace):
+        workspace_layout = layout.read(workspace_id, directory, None,
+                                       required=False)
+        payload_file = layout.read_payload(workspace_id, directory, None)
+    if workspace_layout is None:
+        return False
+    if workspace in existing:
+        # The workspace may have windows to unmap and placeholders to
+        # remove so it must be restored on its own.
+        with trace.span('switch workspace', workspace=workspace):
+            i3.command('workspace --no-auto-back-and-forth '
+                       f'{util.quote(workspace)}')
+        i3.invalidate()
+        with trace.span('restore layout', workspace=workspace):
+            remapped = layout.restore(workspace, workspace_layout,
+                                      payload_file)
+        if tracker is not None:
+            tracker.ignore(remapped)
+        return True
+    if payload_file is None:
+        temp_payload = layout.write_temp_payload(workspace_layout)
+        temp_payloads.append(temp_payload)
+        payload_file = temp_payload.name
+    for command in layout.restore_commands(workspace, workspace_layout,
+                                           payload_file):
+        batch.add(command)
+    return True
 
 
 @main.command('ls')
@@ -141,7 +445,7 @@ def list_workspaces(directory, item):
     if item == 'workspaces':
         workspaces = []
         for entry in directory.iterdir():
-            if entry.is_file():
+            if entry.is_file() and not entry.name.startswith('.'):
                 name = entry.name
                 name = name[name.index('_') + 1:]
                 workspace = name[:name.rfind('_')]
@@ -155,7 +459,7 @@ def list_workspaces(directory, item):
         profiles = []
         try:
             for entry in directory.iterdir():
-                if entry.is_file():
+                if entry.is_file() and not entry.name.startswith('.'):
                     name = entry.name
                     profile = name[:name.rfind('_')]
                     file_type = name[name.rfind('_') + 1:name.index('.json')]
@@ -207,8 +511,12 @@ def remove(workspace, directory, profile, target):
         programs_file.unlink()
 
     if target != 'layout_only':
-        # Delete layout file.
+        # Delete layout file and the files saved along with it.
         layout_file.unlink()
+        for saved_file in [layout.get_payload_file(layout_file),
+                           layout.get_fingerprint_file(layout_file)]:
+            if saved_file.exists():
+                saved_file.unlink()
 
 
 if __name__ == '__main__':
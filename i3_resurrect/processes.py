@@ -0,0 +1,55 @@
+"""
+Snapshot of the process table for looking up the processes of many windows.
+"""
+import psutil
+
+# The details of a process which are looked up.
+ATTRIBUTES = ['exe', 'cmdline', 'cwd']
+
+
+class ProcessSnapshot:
+    """
+    The processes which were running when the snapshot was taken, indexed by
+    parent, from a single pass over the process table.
+
+    Looking up the children of a process with psutil scans the whole process
+    table every time, which adds up for a workspace full of terminals. The
+    details of a process are only read the first time they are looked up,
+    because reading them for every process on the system would take longer
+    than the whole pass.
+    """
+
+    def __init__(self):
+        self._processes = {}
+        self._children = {}
+        self._details = {}
+        for process in psutil.process_iter(['ppid'], ad_value=None):
+            self._processes[process.pid] = process
+            self._children.setdefault(process.info['ppid'], [])\
+                .append(process.pid)
+
+    def children(self, pid):
+        """
+        Get the PIDs of the children of a process, in the order psutil lists
+        them.
+        """
+        return self._children.get(pid, [])
+
+    def details(self, pid):
+        """
+        Get the exe, cmdline and cwd of a process.
+
+        Returns a dict in which each detail which couldn't be read is None, or
+        None if the process wasn't running when the snapshot was taken or has
+        exited since.
+        """
+        if pid not in self._details:
+            process = self._processes.get(pid)
+            if process is None:
+                return None
+            try:
+                self._details[pid] = process.as_dict(ATTRIBUTES,
+                                                     ad_value=None)
+            except psutil.NoSuchProcess:
+                self._details[pid] = None
+        return self._details[pid]
@@ -1,16 +1,26 @@
 import json
+import os
 import shlex
 import shutil
-import subprocess
 import sys
+from collections import Counter
 from pathlib import Path
 
-import i3ipc
-import psutil
-
 from . import config
+from . import processes
+from . import session
+from . import storage
 from . import treeutils
 from . import util
+from . import xwindows
+
+# Window properties and value to add to score when match is found.
+RULE_CRITERIA = {
+    'window_role': 1,
+    'class': 2,
+    'instance': 3,
+    'title': 10,
+}
 
 
 def save(workspace, numeric, directory, profile):
@@ -36,8 +46,8 @@ def save(workspace, numeric, directory, profile):
     programs = get_programs(workspace, numeric)
 
     # Write list of commands to file as JSON.
-    with programs_file.open('w') as f:
-        f.write(json.dumps(programs, indent=2))
+    storage.write_json(programs_file, programs,
+                       config.get('compact_layouts', False))
 
 
 def read(workspace, directory, profile):
@@ -68,39 +78,75 @@ def restore(workspace_name, saved_programs):
     """
     Restore the running programs from an i3 workspace.
     """
-    # Remove already running programs from the list of program to restore.
-    running_programs = get_programs(workspace_name, False)
-    for program in running_programs:
-        if program in saved_programs:
-            saved_programs.remove(program)
-
-    i3 = i3ipc.Connection()
-    for entry in saved_programs:
-        cmdline = entry['command']
-        working_directory = entry['working_directory']
-
-        # If the working directory does not exist, set working directory to
-        # user's home directory.
-        if not Path(working_directory).exists():
-            working_directory = Path.home()
-
-        # If cmdline is array, join it into one string for use with i3's exec
-        # command.
-        if isinstance(cmdline, list):
-            # Quote each argument of the command in case some of
-            # them contain spaces. Also protect quotes contained in the
-            # arguments and those to be added from i3's command parser.
-            cmdline = [
-                '\\"' + arg.replace('"', '\\\\\\"') + '\\"'
-                for arg in cmdline
-                if arg != ""
-            ]
-            command = ' '.join(cmdline)
+    # Skip the programs which are already running. Each running program
+    # stands in for one saved program with the same identity, so that
+    # programs which were saved several times are restored the right number
+    # of times.
+    running_programs = Counter()
+    if saved_programs != []:
+        running_programs = Counter(
+            get_program_identity(program)
+            for program in get_programs(workspace_name, False)
+        )
+    missing_programs = []
+    for program in saved_programs:
+        identity = get_program_identity(program)
+        if running_programs[identity] > 0:
+            running_programs[identity] -= 1
         else:
-            command = cmdline
+            missing_programs.append(program)
+
+    # The exec commands are sent to i3 in as few messages as possible.
+    with session.get().batch() as batch:
+        for entry in missing_programs:
+            cmdline = entry['command']
+            working_directory = entry['working_directory']
+
+            # If the working directory does not exist, set working directory
+            # to user's home directory.
+            if not Path(working_directory).exists():
+                working_directory = Path.home()
+
+            # If cmdline is array, join it into one string for use with i3's
+            # exec command.
+            if isinstance(cmdline, list):
+                # Quote each argument of the command in case some of
+                # them contain spaces. Also protect quotes contained in the
+                # arguments and those to be added from i3's command parser.
+                cmdline = [
+                    '\\"' + arg.replace('"', '\\\\\\"') + '\\"'
+                    for arg in cmdline
+                    if arg != ""
+                ]
+                command = ' '.join(cmdline)
+            else:
+                command = cmdline
+
+            # Execute command via i3 exec.
+            batch.add(f'exec "cd \\"{working_directory}\\" && {command}"')
+    for command, error in batch.errors():
+        util.eprint(f'Could not restore program: {error}\n  {command}')
+
 
-        # Execute command via i3 exec.
-        i3.command(f'exec "cd \\"{working_directory}\\" && {command}"')
+def get_program_identity(program):
+    """
+    Get a hashable identity for a saved or running program, which is the same
+    for programs that would be launched the same way.
+
+    Returns:
+        A tuple of the command's arguments without empty ones, and the
+        normalised working directory.
+    """
+    command = program['command']
+    if isinstance(command, str):
+        try:
+            command = shlex.split(command)
+        except ValueError:
+            command = [command]
+    command = tuple(arg for arg in command if arg != '')
+    working_directory = os.path.normpath(
+        os.path.expanduser(program['working_directory']))
+    return (command, working_directory)
 
 
 def get_programs(workspace, numeric):
@@ -111,6 +157,11 @@ def get_programs(workspace, numeric):
         workspace: The workspace to search.
         numeric: Identify workspace by number instead of name.
     """
+    # Look up the processes of every window in a single snapshot of the
+    # process table.
+    snapshot = processes.ProcessSnapshot()
+    terminals = config.get('terminals', [])
+
     # Loop through windows and save commands to launch programs on saved
     # workspace.
     programs = []
@@ -118,21 +169,18 @@ def get_programs(workspace, numeric):
         if pid == 0:
             continue
 
-        # Get process info for the window.
-        procinfo = psutil.Process(pid)
-
-        # Try to get absolute path to executable.
-        exe = None
-        try:
-            exe = procinfo.exe()
-        except Exception:
-            pass
+        # Get process info for the window, skipping windows whose process
+        # has exited or can't be inspected.
+        procinfo = snapshot.details(pid)
+        if procinfo is None or not procinfo['cmdline']:
+            continue
 
-        # Create command to launch program.
+        # Create command to launch program. The absolute path to the
+        # executable is None if it couldn't be read.
         command = get_window_command(
             con['window_properties'],
-            procinfo.cmdline(),
-            exe,
+            procinfo['cmdline'],
+            procinfo['exe'],
         )
         if command in ([], ''):
             continue
@@ -140,17 +188,19 @@ def get_programs(workspace, numeric):
         # Remove empty string arguments from command.
         command = [arg for arg in command if arg != '']
 
-        terminals = config.get('terminals', [])
-
-        try:
-            # Obtain working directory using psutil.
-            if con['window_properties']['class'] in terminals:
-                # If the program is a terminal emulator, get the working
-                # directory from its first subprocess.
-                working_directory = procinfo.children()[0].cwd()
-            else:
-                working_directory = procinfo.cwd()
-        except Exception:
+        # Obtain working directory from the snapshot.
+        working_directory = None
+        if con['window_properties']['class'] in terminals:
+            # If the program is a terminal emulator, get the working
+            # directory from its first subprocess.
+            children = snapshot.children(pid)
+            if children != []:
+                child_info = snapshot.details(children[0])
+                if child_info is not None:
+                    working_directory = child_info['cwd']
+        else:
+            working_directory = procinfo['cwd']
+        if working_directory is None:
             working_directory = str(Path.home())
 
         # Add the command to the list.
@@ -166,45 +216,55 @@ def windows_in_workspace(workspace, numeric):
     """
     Generator to iterate over windows in a workspace.
 
+    The PIDs of all the windows are looked up in a single batch.
+
     Args:
         workspace: The name of the workspace whose windows to iterate over.
     """
     ws = treeutils.get_workspace_tree(workspace, numeric)
-    for con in treeutils.get_leaves(ws):
-        pid = get_window_pid(con)
-        yield (con, pid)
+    windows = list(treeutils.get_leaves(ws))
+    pids = get_window_pids(windows)
+    for con in windows:
+        yield (con, pids.get(con['window'], 0))
 
 
-def get_window_pid(con):
+def get_window_pids(cons):
     """
-    Get window PID using xprop.
+    Get the PIDs of several windows over a single X connection, or with a
+    single xprop run if that isn't possible.
 
     Args:
-        con: The window container node whose PID to look up.
+        cons: The window container nodes whose PIDs to look up.
+
+    Returns:
+        A dict mapping window ids to PIDs, which are 0 if they aren't known.
     """
-    window_id = con['window']
-    if window_id is None:
-        return 0
+    window_ids = [con['window'] for con in cons if con['window'] is not None]
+    with xwindows.PropertyReader() as reader:
+        properties = reader.read(window_ids)
+    return {
+        window_id: window_properties['pid']
+        for window_id, window_properties in properties.items()
+    }
 
-    try:
-        xprop_output = subprocess.check_output(
-            shlex.split(f'xprop _NET_WM_PID -id {window_id}'),
-            stderr=subprocess.DEVNULL,
-        ).decode('utf-8').split(' ')
-        pid = int(xprop_output[len(xprop_output) - 1])
-    except (subprocess.CalledProcessError, ValueError, IndexError):
-        return 0
 
-    return pid
+def get_window_pid(con):
+    """
+    Get window PID.
+
+    Args:
+        con: The window container node whose PID to look up.
+    """
+    return get_window_pids([con]).get(con['window'], 0)
 
 
 def get_window_command(window_properties, cmdline, exe):
     """
     Gets a window command.
 
-    This function starts with the process's cmdline, then loops through the
-    window mappings and scores each matching rule. The command mapping with the
-    highest score is then returned.
+    This function starts with the process's cmdline, then looks up the
+    window mapping with the highest score in the index of the mappings. The
+    command from that mapping is then returned.
     """
     window_command_mappings = config.get('window_command_mappings', [])
 
@@ -234,15 +294,8 @@ def get_window_command(window_properties, cmdline, exe):
         return command
 
     # Find the mapping that gets the highest score.
-    current_score = 0
-    best_match = None
-    for rule in window_command_mappings:
-        # Calculate score.
-        score = calc_rule_match_score(rule, window_properties)
-
-        if score > current_score:
-            current_score = score
-            best_match = rule
+    best_match = get_rule_index(window_command_mappings)\
+        .best_match(window_properties)
 
     # If no match found, just use the original cmdline.
     if best_match is None:
@@ -269,20 +322,89 @@ def calc_rule_match_score(rule, window_properties):
 
     Scoring is done based on which criteria are considered "more specific".
     """
-    # Window properties and value to add to score when match is found.
-    criteria = {
-        'window_role': 1,
-        'class': 2,
-        'instance': 3,
-        'title': 10,
-    }
-
     score = 0
-    for criterion in criteria:
+    for criterion in RULE_CRITERIA:
         if criterion in rule:
             # Score is zero if there are any non-matching criteria.
             if (criterion not in window_properties
                     or rule[criterion] != window_properties[criterion]):
                 return 0
-            score += criteria[criterion]
+            score += RULE_CRITERIA[criterion]
     return score
+
+
+class RuleIndex:
+    """
+    Index of window command mappings which finds the mapping that
+    calc_rule_match_score scores highest for a window, taking the first one
+    if several score the same, without scoring every mapping.
+
+    Mappings are grouped by the criteria they have, such as class and
+    instance or class and title, and each group is a dict keyed by the values
+    of those criteria. A mapping matches a window only if all of its criteria
+    are equal to the window's properties, so a window has at most one
+    matching entry per group and finding the best match takes a lookup in
+    each group, of which there are at most 15, however many mappings there
+    are. Title mappings end up in their own groups and don't slow down the
+    lookups by class, instance and role.
+    """
+
+    def __init__(self, rules):
+        groups = {}
+        for index, rule in enumerate(rules):
+            criteria = tuple(c for c in RULE_CRITERIA if c in rule)
+            if criteria == ():
+                # Mappings without criteria score zero, so they never match.
+                continue
+            try:
+                key = tuple(rule[c] for c in criteria)
+                # Only the first of several mappings with the same criteria
+                # can be the best match.
+                groups.setdefault(criteria, {}).setdefault(key, (index, rule))
+            except TypeError:
+                # A value which can't be hashed can't be equal to a window
+                # property either.
+                continue
+        # The groups are checked from the highest score down.
+        self.groups = sorted(
+            (
+                (sum(RULE_CRITERIA[c] for c in criteria), criteria, group)
+                for criteria, group in groups.items()
+            ),
+            key=lambda entry: -entry[0],
+        )
+
+    def best_match(self, window_properties):
+        """
+        Get the best matching mapping for a window, or None if no mapping
+        matches.
+        """
+        best = None
+        for score, criteria, group in self.groups:
+            if best is not None and score < best[0]:
+                break
+            try:
+                key = tuple(window_properties[c] for c in criteria)
+                entry = group.get(key)
+            except (KeyError, TypeError):
+                continue
+            if entry is not None and (best is None or entry[0] < best[1]):
+                best = (score, entry[0], entry[1])
+        if best is None:
+            return None
+        return best[2]
+
+
+def get_rule_index(rules):
+    """
+    Get the index of a list of window command mappings, which is built once
+    and reused for as long as the same list is passed in.
+    """
+    global _rule_index
+
+    if _rule_index is None or _rule_index[0] is not rules:
+        _rule_index = (rules, RuleIndex(rules))
+    return _rule_index[1]
+
+
+_rule_index = None
@@ -0,0 +1,111 @@
+"""
+Helpers for waiting until things are ready without busy waiting or fixed
+sleeps.
+"""
+import os
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# Polling intervals used when inotify can't be used.
+POLL_INITIAL = 0.01
+POLL_MAX = 0.2
+
+
+def wait_for_paths(paths, timeout):
+    """
+    Wait until all of the given paths exist.
+
+    The directories containing the paths are watched with inotify if possible,
+    otherwise the paths are polled with exponential backoff.
+
+    Args:
+        paths: The paths to wait for.
+        timeout: The maximum time to wait in seconds.
+
+    Returns:
+        The set of paths which still don't exist when the timeout is reached.
+    """
+    pending = set(paths)
+    pending.difference_update(iter_paths(list(pending), timeout))
+    return pending
+
+
+def iter_paths(paths, timeout):
+    """
+    Generator which yields each of the given paths as soon as it exists, so
+    that whatever depends on a path can carry on without waiting for the rest.
+
+    Stops when every path has been yielded or the timeout is reached.
+
+    Args:
+        paths: The paths to wait for.
+        timeout: The maximum time to wait in seconds.
+    """
+    deadline = time.monotonic() + timeout
+    pending = set(paths)
+
+    def take_existing():
+        existing = [path for path in pending if os.path.exists(path)]
+        pending.difference_update(existing)
+        return existing
+
+    yield from take_existing()
+    if not pending:
+        return
+
+    directories = {os.path.dirname(path) or '.' for path in pending}
+    if pyinotify is None or not all(map(os.path.isdir, directories)):
+        interval = POLL_INITIAL
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, POLL_MAX)
+            yield from take_existing()
+            if not pending:
+                return
+
+    watch_manager = pyinotify.WatchManager()
+    for directory in directories:
+        watch_manager.add_watch(
+            directory,
+            pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO,
+        )
+    notifier = pyinotify.Notifier(watch_manager, pyinotify.ProcessEvent())
+    try:
+        while True:
+            # Check again after every event, and also before the first wait in
+            # case the paths were created before the watches were added.
+            yield from take_existing()
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                return
+            if notifier.check_events(int(remaining * 1000) + 1):
+                notifier.read_events()
+                notifier.process_events()
+    finally:
+        notifier.stop()
+
+
+def wait_until(predicate, timeout):
+    """
+    Poll a predicate with exponential backoff until it returns True.
+
+    Returns whether the predicate returned True before the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    interval = POLL_INITIAL
+    while True:
+        if predicate():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, POLL_MAX)
+
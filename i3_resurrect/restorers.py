@@ -0,0 +1,123 @@
+"""
+Registry of restorers which launch the apps of a workspace.
+
+Each restorer launches one kind of app, usually the one whose state is
+captured by the extractor of the same name, and declares how to tell when its
+apps are ready and which restorers' apps must be ready before it can launch
+its own. Restorers which don't depend on each other run concurrently.
+"""
+from . import trace
+from . import util
+
+
+class Restorer:
+    """
+    Launches the apps of one kind.
+
+    Args:
+        name: The name of the restorer.
+        launch: Function called with the restore context which launches the
+            apps. It returns whether anything was launched.
+        ready: Function called with the restore context after launching
+            something, which waits until the apps are ready, or None if they
+            are ready as soon as they are launched.
+        requires: The names of the restorers whose apps must be ready before
+            this one launches its apps.
+        window_class: The class of the windows its apps open, or None if they
+            don't open any.
+    """
+
+    def __init__(self, name, launch, ready=None, requires=(),
+                 window_class=None):
+        self.name = name
+        self.launch = launch
+        self.ready = ready
+        self.requires = tuple(requires)
+        self.window_class = window_class
+
+
+class Context:
+    """
+    What the restorers of a workspace work with.
+
+    Args:
+        saved_apps: The saved apps to launch.
+        workspace_name: The name of the workspace being restored.
+        launcher: The Launcher to launch programs with.
+        watcher: The started WindowWatcher to watch for windows with, or None
+            if windows can't be watched for.
+    """
+
+    def __init__(self, saved_apps, workspace_name, launcher, watcher=None):
+        self.saved_apps = saved_apps
+        self.workspace_name = workspace_name
+        self.launcher = launcher
+        self.watcher = watcher
+        # State shared by the restorers, keyed by name.
+        self.state = {}
+        # The names of the restorers which launched something.
+        self.launched = set()
+
+
+def register(restorer):
+    """
+    Add a restorer to the registry.
+
+    The restorers it requires must already be registered, which keeps the
+    registry in an order they can be run in.
+    """
+    names = [r.name for r in _restorers]
+    for name in restorer.requires:
+        if name not in names:
+            raise ValueError(f'Restorer "{restorer.name}" requires "{name}" '
+                             'which is not registered')
+    _restorers.append(restorer)
+
+
+def run(context):
+    """
+    Run every registered restorer and wait for them all to finish.
+
+    Each restorer runs in the launcher's thread pool as soon as the restorers
+    it requires have their apps ready. They are submitted in the order they
+    were registered, so a restorer only ever waits for ones which were taken
+    from the pool's queue before it and the pool can't deadlock.
+
+    Returns the classes of the windows of the apps which were launched.
+    """
+    futures = {}
+    for restorer in _restorers:
+        dependencies = {name: futures[name] for name in restorer.requires}
+        futures[restorer.name] = context.launcher.submit(
+            _run, restorer, context, dependencies)
+    for name, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            util.eprint(f'Could not restore {name}: {e}')
+    return {
+        restorer.window_class for restorer in _restorers
+        if restorer.name in context.launched
+        and restorer.window_class is not None
+    }
+
+
+def _run(restorer, context, dependencies):
+    # Returns whether the restorer ran, so that the restorers which require
+    # it are skipped if it didn't.
+    for name, future in dependencies.items():
+        if future.exception() is not None or not future.result():
+            util.eprint(f'Not restoring {restorer.name} because {name} could '
+                        'not be restored')
+            return False
+    with trace.span(restorer.name, 'restorer'):
+        launched = restorer.launch(context)
+    if launched:
+        context.launched.add(restorer.name)
+    if launched and restorer.ready is not None:
+        with trace.span(f'wait for {restorer.name}', 'restorer'):
+            restorer.ready(context)
+    return True
+
+
+_restorers = []
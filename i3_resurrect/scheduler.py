@@ -0,0 +1,185 @@
+"""
+Scheduling of program launches according to how busy the system is.
+"""
+import os
+import threading
+import time
+
+import psutil
+
+from . import config
+from . import readiness
+from . import util
+
+# The minimum time in seconds the CPU idle time is measured over. Readings over
+# a shorter time are mostly noise, and one taken straight after another has
+# nothing to measure and reports no idle time at all.
+CPU_SAMPLE_INTERVAL = 0.1
+
+
+class LaunchScheduler:
+    """
+    Admits program launches when the system has room for them.
+
+    A launch is admitted straight away while the load average per CPU, the
+    CPU idle time, the available memory and the number of launches whose
+    windows haven't opened yet are all within their limits. Otherwise it
+    waits until they are, but never longer than max_wait so that a busy
+    system makes restoring slower instead of stalling it. Launches can be
+    admitted from several threads at once, and each one counts as pending as
+    soon as it's admitted until a window of its class opens, it's released
+    because it failed, or window_timeout has passed.
+    """
+
+    def __init__(self, max_pending=None, max_load=2.0, min_cpu_idle=10.0,
+                 min_available_memory=200, max_wait=10.0, niceness=None,
+                 ionice_class=None, window_timeout=10.0):
+        """
+        Args:
+            max_pending: The maximum number of launches whose windows haven't
+                opened yet. Defaults to the number of CPUs.
+            max_load: The maximum 1 minute load average per CPU.
+            min_cpu_idle: The minimum percentage of CPU time spent idle.
+            min_available_memory: The minimum available memory in MiB.
+            max_wait: The maximum time in seconds to hold back a launch.
+            niceness: The niceness to launch programs with, if any.
+            ionice_class: The I/O scheduling class to launch programs with, if
+                any, as accepted by ionice(1).
+            window_timeout: The time in seconds after which a launch whose
+                window hasn't opened no longer counts as pending.
+        """
+        self.cpu_count = os.cpu_count() or 1
+        self.max_pending = max_pending or self.cpu_count
+        self.max_load = max_load
+        self.min_cpu_idle = min_cpu_idle
+        self.min_available_memory = min_available_memory * 1024 * 1024
+        self.max_wait = max_wait
+        self.niceness = niceness
+        self.ionice_class = ionice_class
+        self.window_timeout = window_timeout
+        # The number of windows counts towards the limit only if something
+        # reports the windows as they open.
+        self.count_pending = False
+        # Maps the launches whose windows haven't opened yet to when they
+        # were admitted.
+        self._pending = {}
+        self._lock = threading.Lock()
+        # The first reading of the CPU times is meaningless, it only sets the
+        # start of the interval for the next one. Until that interval is long
+        # enough the CPU idle time is unknown and doesn't hold launches back.
+        psutil.cpu_times_percent(interval=None)
+        self._cpu_sampled = time.perf_counter()
+        self._cpu_idle = None
+
+    @classmethod
+    def from_config(cls):
+        """
+        Create a scheduler with the limits from the config file.
+        """
+        return cls(
+            max_pending=config.get('launch_max_pending', None),
+            max_load=config.get('launch_max_load', 2.0),
+            min_cpu_idle=config.get('launch_min_cpu_idle', 10.0),
+            min_available_memory=config.get('launch_min_available_memory',
+                                            200),
+            max_wait=config.get('launch_max_wait', 10.0),
+            niceness=config.get('launch_nice', None),
+            ionice_class=config.get('launch_ionice', None),
+            window_timeout=config.get('launch_window_timeout', 10.0),
+        )
+
+    def admit(self, launch):
+        """
+        Wait until there is room for another launch and count it as pending.
+
+        Args:
+            launch: The Launch to admit. Its window_class is matched against
+                the windows which open.
+
+        Returns the time in seconds that the launch was held back for.
+        """
+        start = time.perf_counter()
+        if not readiness.wait_until(lambda: self._try_admit(launch),
+                                    self.max_wait):
+            util.vprint(f'Launching after waiting {self.max_wait} seconds '
+                        'for the system to be less busy')
+            with self._lock:
+                self._pending[launch] = time.perf_counter()
+        return time.perf_counter() - start
+
+    def release(self, launch):
+        """
+        Stop counting a launch as pending, such as when its program couldn't
+        be started.
+        """
+        with self._lock:
+            self._pending.pop(launch, None)
+
+    def has_room(self):
+        """
+        Check whether the system has room for another launch right now.
+        """
+        with self._lock:
+            return self._has_room()
+
+    def _try_admit(self, launch):
+        # The check and the count happen under one lock so that launches
+        # admitted from several threads at once can't go over max_pending.
+        with self._lock:
+            if not self._has_room():
+                return False
+            self._pending[launch] = time.perf_counter()
+            return True
+
+    def _has_room(self):
+        # Launches whose windows never opened stop holding back others.
+        expired = time.perf_counter() - self.window_timeout
+        for launch, admitted in list(self._pending.items()):
+            if admitted < expired:
+                del self._pending[launch]
+        if self.count_pending and len(self._pending) >= self.max_pending:
+            return False
+        if os.getloadavg()[0] / self.cpu_count > self.max_load:
+            return False
+        cpu_idle = self._get_cpu_idle()
+        if cpu_idle is not None and cpu_idle < self.min_cpu_idle:
+            return False
+        available = psutil.virtual_memory().available
+        return available >= self.min_available_memory
+
+    def _get_cpu_idle(self):
+        # Measure the CPU idle time since the last reading, unless it was taken
+        # too recently, in which case it's still the latest measurement.
+        now = time.perf_counter()
+        if now - self._cpu_sampled >= CPU_SAMPLE_INTERVAL:
+            self._cpu_idle = psutil.cpu_times_percent(interval=None).idle
+            self._cpu_sampled = now
+        return self._cpu_idle
+
+    def window_opened(self, container):
+        """
+        Record that a window has opened, so the oldest pending launch of its
+        class is done. Windows which weren't launched through the scheduler
+        are ignored. Called by the window watcher.
+        """
+        window_class = container.get('window_properties', {}).get('class')
+        if window_class is None:
+            return
+        with self._lock:
+            for launch in self._pending:
+                if (launch.window_class is not None
+                        and launch.window_class.lower()
+                        == window_class.lower()):
+                    del self._pending[launch]
+                    return
+
+    def wrap(self, command):
+        """
+        Wrap a command so that it runs with the configured priorities. They
+        are inherited by any processes the program starts.
+        """
+        if self.ionice_class is not None:
+            command = ['ionice', '-c', str(self.ionice_class)] + command
+        if self.niceness is not None:
+            command = ['nice', '-n', str(self.niceness)] + command
+        return command
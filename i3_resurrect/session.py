@@ -0,0 +1,190 @@
+"""
+Lazy-initialized singleton for the i3 session shared by a single invocation.
+
+All modules talk to i3 through the same IPC connection and read the same
+layout tree snapshot. The snapshot is fetched on first use and kept until it
+is explicitly invalidated by code which changes the tree.
+"""
+import json
+
+import i3ipc
+
+# The tree is requested through i3ipc's private API, which may change in any
+# release, so the public one is used instead if it isn't there.
+try:
+    from i3ipc._private import MessageType
+    GET_TREE = MessageType.GET_TREE
+except (ImportError, AttributeError):
+    GET_TREE = None
+
+# The maximum length in bytes of a message of batched commands.
+MAX_BATCH_SIZE = 64 * 1024
+
+
+class Session:
+    """
+    Owns one persistent i3 IPC connection and a cached layout tree snapshot.
+    """
+
+    def __init__(self, connection=None):
+        self._i3 = connection
+        self._tree = None
+        self._derived = {}
+
+    @property
+    def i3(self):
+        """
+        The i3 IPC connection, opened on first use.
+        """
+        if self._i3 is None:
+            self._i3 = i3ipc.Connection()
+        return self._i3
+
+    def get_tree(self):
+        """
+        Get the raw layout tree from i3, fetching it only if there is no valid
+        snapshot.
+        """
+        if self._tree is None:
+            message = getattr(self.i3, '_message', None)
+            if GET_TREE is not None and message is not None:
+                # Skip building i3ipc.Con objects for the whole tree since we
+                # only ever work with the raw data.
+                self._tree = json.loads(message(GET_TREE, ''))
+            else:
+                self._tree = self.i3.get_tree().ipc_data
+        return self._tree
+
+    def get_derived(self, key, build):
+        """
+        Get data derived from the tree snapshot, such as an index. It is built
+        by calling build with the tree the first time and is discarded along
+        with the snapshot.
+        """
+        if key not in self._derived:
+            self._derived[key] = build(self.get_tree())
+        return self._derived[key]
+
+    def invalidate(self):
+        """
+        Discard the tree snapshot. Must be called after anything which changes
+        the layout tree if the tree is going to be read again.
+        """
+        self._tree = None
+        self._derived.clear()
+
+    def command(self, payload):
+        """
+        Send a command to i3 over the shared connection.
+        """
+        return self.i3.command(payload)
+
+    def batch(self, max_size=MAX_BATCH_SIZE):
+        """
+        Start a batch of commands to send to i3 over the shared connection.
+        """
+        return CommandBatch(self, max_size)
+
+
+class CommandBatch:
+    """
+    Buffers i3 commands and sends them joined with ';' in as few messages as
+    possible, then maps i3's replies back to the commands they belong to.
+
+    Commands are sent when flush() is called, when adding one would make the
+    message longer than max_size, and when leaving the batch's with block.
+
+    i3 replies with a result for every command it runs, including each of the
+    commands separated by ',' within a command, so the replies are mapped back
+    by counting those. It stops at a command it can't parse, and the commands
+    after that get no replies.
+    """
+
+    def __init__(self, session, max_size=MAX_BATCH_SIZE):
+        self.session = session
+        self.max_size = max_size
+        # (command, replies) for every command sent so far.
+        self.results = []
+        self._pending = []
+        self._size = 0
+
+    def add(self, command):
+        """
+        Add a command to the batch.
+        """
+        size = len(command.encode('utf-8'))
+        if self._pending != [] and self._size + 1 + size > self.max_size:
+            self.flush()
+        self._pending.append(command)
+        self._size += size + (1 if len(self._pending) > 1 else 0)
+
+    def flush(self):
+        """
+        Send the buffered commands to i3 in a single message.
+        """
+        if self._pending == []:
+            return
+        commands = self._pending
+        self._pending = []
+        self._size = 0
+        replies = list(self.session.command(';'.join(commands)))
+        for command in commands:
+            count = count_commands(command)
+            self.results.append((command, replies[:count]))
+            replies = replies[count:]
+
+    def errors(self):
+        """
+        Get the commands sent so far which failed or weren't run, along with
+        i3's error message.
+        """
+        errors = []
+        for command, replies in self.results:
+            if replies == []:
+                errors.append((command, 'Not run'))
+            for reply in replies:
+                if not reply.success:
+                    errors.append((command, reply.error))
+                    break
+        return errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.flush()
+
+
+def count_commands(command):
+    """
+    Count the commands which i3 runs for a command string, which are
+    separated by ',' or ';' outside of quoted strings.
+    """
+    count = 1
+    quoted = False
+    escaped = False
+    for char in command:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char in ',;' and not quoted:
+            count += 1
+    return count
+
+
+def get():
+    """
+    Gets the session for this invocation.
+    """
+    global _session
+
+    if _session is None:
+        _session = Session()
+    return _session
+
+
+_session = None
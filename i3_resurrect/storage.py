@@ -0,0 +1,112 @@
+"""
+Writing of saved files.
+
+Files are serialised straight to a temporary file next to the destination and
+then renamed over it, so a save which is interrupted never leaves a truncated
+file behind.
+"""
+import json
+import os
+
+from . import treeutils
+
+# The keys which hold the children of a layout tree node.
+CHILD_KEYS = ('nodes', 'floating_nodes')
+
+
+def write_json(path, data, compact=False):
+    """
+    Write data to a file as JSON, replacing the file atomically.
+
+    Args:
+        path: The path of the file to write.
+        data: The data to write.
+        compact: Whether to leave out indentation and layout tree attributes
+            holding the values i3 uses when they are missing.
+    """
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with tmp_path.open('w') as f:
+            if compact:
+                for chunk in iterencode_compact(data):
+                    f.write(chunk)
+            else:
+                json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def iterencode_compact(data):
+    """
+    Encode data as compact JSON in chunks, leaving out default attributes of
+    the layout tree nodes in it.
+
+    Layout trees are encoded a node at a time so that the whole file is never
+    held in memory, while the attributes of each node are still encoded in
+    one go by the C encoder. An explicit stack is used so that there is no
+    limit on the depth of the tree.
+    """
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    # Each entry is an iterator over the parts left to encode and whether
+    # the dicts among them are layout tree nodes.
+    stack = [(iter([data]), _is_node(data))]
+    while stack:
+        parts, nodes = stack[-1]
+        part = next(parts, _END)
+        if part is _END:
+            stack.pop()
+        elif isinstance(part, _Raw):
+            yield part.text
+        elif isinstance(part, dict) and (nodes or _is_node(part)):
+            attributes = {
+                key: value for key, value in part.items()
+                if key not in CHILD_KEYS and not _is_default(key, value)
+            }
+            yield encode(attributes)[:-1]
+            children = []
+            separator = ',' if attributes else ''
+            for key in CHILD_KEYS:
+                if key in part:
+                    children += [_Raw(f'{separator}{encode(key)}:'),
+                                 part[key]]
+                    separator = ','
+            children.append(_Raw('}'))
+            stack.append((iter(children), True))
+        elif isinstance(part, (list, tuple)):
+            items = [_Raw('[')]
+            for index, item in enumerate(part):
+                if index > 0:
+                    items.append(_Raw(','))
+                items.append(item)
+            items.append(_Raw(']'))
+            stack.append((iter(items), nodes or any(map(_is_node, part))))
+        else:
+            yield encode(part)
+
+
+class _Raw:
+    """
+    Text which is written as is instead of being encoded.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+
+# Marks the end of the parts left to encode.
+_END = object()
+
+
+def _is_node(value):
+    return isinstance(value, dict) and any(
+        key in value for key in CHILD_KEYS + ('swallows',))
+
+
+def _is_default(key, value):
+    return (key in treeutils.DEFAULT_ATTRIBUTES
+            and treeutils.DEFAULT_ATTRIBUTES[key] == value)
@@ -0,0 +1,163 @@
+"""
+Recording of a timeline of what happens during a restore, which can be
+written out in the Chrome trace event format and viewed in Perfetto or
+chrome://tracing.
+
+Tracing is off unless enable() is called, and recording anything is then a
+no-op, so tracing calls can be left in place everywhere.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Collects trace events from any thread.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def timestamp(self, perf_counter=None):
+        """
+        Convert a time.perf_counter() value, or the current time, to a trace
+        timestamp in microseconds.
+        """
+        if perf_counter is None:
+            perf_counter = time.perf_counter()
+        return (perf_counter - self._start) * 1e6
+
+    def complete(self, name, start, end, category, args):
+        """
+        Record a span between two time.perf_counter() values.
+        """
+        self._add({
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': self.timestamp(start),
+            'dur': (end - start) * 1e6,
+            'args': args,
+        })
+
+    def instant(self, name, category, args):
+        """
+        Record something which happened at a single point in time.
+        """
+        self._add({
+            'name': name,
+            'cat': category,
+            'ph': 'i',
+            's': 't',
+            'ts': self.timestamp(),
+            'args': args,
+        })
+
+    def write(self, path):
+        """
+        Write the trace to a file.
+        """
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        pid = os.getpid()
+        for event in events:
+            event['pid'] = pid
+        # Name the threads so that they are labelled in the viewer.
+        for thread_name, tid in threads.items():
+            events.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': pid,
+                'tid': tid,
+                'args': {'name': thread_name},
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def _add(self, event):
+        thread_name = threading.current_thread().name
+        with self._lock:
+            event['tid'] = self._threads.setdefault(thread_name,
+                                                    len(self._threads) + 1)
+            self.events.append(event)
+
+
+def enable():
+    """
+    Start recording trace events.
+    """
+    global _tracer
+
+    _tracer = Tracer()
+
+
+def enabled():
+    """
+    Check whether trace events are being recorded.
+    """
+    return _tracer is not None
+
+
+def span(name, category='restore', **args):
+    """
+    Context manager which records the time spent in its block as a span.
+    """
+    if _tracer is None:
+        return _null_span
+    return _span(_tracer, name, category, args)
+
+
+def complete(name, start, end, category='restore', **args):
+    """
+    Record a span between two time.perf_counter() values which have already
+    been measured.
+    """
+    if _tracer is not None:
+        _tracer.complete(name, start, end, category, args)
+
+
+def instant(name, category='restore', **args):
+    """
+    Record something which happened at a single point in time.
+    """
+    if _tracer is not None:
+        _tracer.instant(name, category, args)
+
+
+def write(path):
+    """
+    Write the recorded trace events to a file.
+    """
+    if _tracer is not None:
+        _tracer.write(path)
+
+
+@contextmanager
+def _span(tracer, name, category, args):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.complete(name, start, time.perf_counter(), category, args)
+
+
+class _NullSpan:
+    # Span which records nothing, used while tracing is off. It's the same as
+    # contextlib.nullcontext, which isn't available before Python 3.7.
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_span = _NullSpan()
+_tracer = None
@@ -1,11 +1,9 @@
-import json
+import itertools
 import re
-import shlex
-import subprocess
-# import psutil
 
 from . import config
-# from . import programs
+from . import extractors
+from . import session
 
 # The tree node attributes that we want to save.
 REQUIRED_ATTRIBUTES = [
@@ -26,16 +24,64 @@ REQUIRED_ATTRIBUTES = [
     'workspace_layout',
 ]
 
+# The values i3 gives the required attributes when they are missing from a
+# layout, so they can be left out of compact layout files. border is left out
+# because its default comes from the i3 config, and orientation because i3
+# uses it to fill in the split direction of containers with the default
+# layout.
+DEFAULT_ATTRIBUTES = {
+    'current_border_width': -1,
+    'floating': 'auto_off',
+    'fullscreen_mode': 0,
+    'geometry': {'x': 0, 'y': 0, 'width': 0, 'height': 0},
+    'marks': [],
+    'name': None,
+    'percent': None,
+    'scratchpad_state': 'none',
+    'sticky': False,
+    'title_format': None,
+    'type': 'con',
+    'workspace_layout': 'default',
+}
 
-def process_node(original, swallow, app_specific = {}):
+# Marks the end of a list of children during traversal.
+_END = object()
+
+
+def process_node(original, swallow, app_specific=None):
     """
-    Recursive function which traverses a layout tree and builds a new tree from
-    it which can be restored using append_layout and only contains attributes
-    necessary for accurately restoring the layout.
+    Traverses a layout tree and builds a new tree from it which can be
+    restored using append_layout and only contains attributes necessary for
+    accurately restoring the layout.
+    """
+    if app_specific is None:
+        app_specific = {}
+    # Get swallow criteria from config.
+    window_swallow_mappings = config.get('window_swallow_criteria', {})
+
+    processed_root = _process_container(original, swallow, app_specific,
+                                        window_swallow_mappings)
+    # Map each original container to its processed copy so that children can
+    # be added to the right parent. Parents are always visited first.
+    processed_containers = {id(original): processed_root}
+    for parent, node_type, node in walk(original):
+        processed = _process_container(node, swallow, app_specific,
+                                       window_swallow_mappings)
+        processed_containers[id(node)] = processed
+        processed_containers[id(parent)]\
+            .setdefault(node_type, [])\
+            .append(processed)
+
+    return processed_root
+
+
+def _process_container(original, swallow, app_specific,
+                       window_swallow_mappings):
+    """
+    Builds a copy of a single container without its children.
     """
     processed = {}
 
-    # Base case.
     if original is None or original == {}:
         return processed
 
@@ -53,110 +99,199 @@ def process_node(original, swallow, app_specific = {}):
         processed['swallows'] = [{}]
         # Local variable for swallow criteria.
         swallow_criteria = swallow
-        # Get swallow criteria from config.
-        window_swallow_mappings = config.get('window_swallow_criteria', {})
-        window_class = original['window_properties'].get('class', '')
+        window_properties = original['window_properties']
+        window_class = window_properties.get('class', '')
         # Swallow criteria from config override the command line parameters
         # if present.
         if window_class in window_swallow_mappings:
             swallow_criteria = window_swallow_mappings[window_class]
         for criterion in swallow_criteria:
-            if criterion in original['window_properties']:
-                orig_prop = original['window_properties'][criterion]
+            if criterion in window_properties:
                 escaped = None
                 if criterion == 'title':
-                    kak_match = re.fullmatch(r"(.+) (\d+):(\d+) (?:\[\+\])? \d+ sel(?:s)?(?: \(\d+\))? - (.+)@\[(.+)\] - Kakoune", orig_prop)
-                    if kak_match:
-                        # we can assume that this is being run by a terminal
-                        # so we need to get the working directory from the 
-                        # child process of the terminal
-                        # pid = programs.get_window_pid(original)
-                        # procinfo = psutil.Process(pid)
-                        # working_directory = procinfo.children()[0].cwd()
-                        
-                        file_path = kak_match.group(1)
-                        line = kak_match.group(2)
-                        column = kak_match.group(3)
-                        client_name = kak_match.group(4)
-                        session_name = kak_match.group(5)
-                        app_specific\
-                            .setdefault('kakoune_sessions', {})\
-                            .setdefault(session_name, {})\
-                            .setdefault('clients', {})\
-                            [client_name] = {
-                                # 'working_directory': working_directory,
-                                'path': file_path,
-                                'line': line,
-                                'column': column
-                            }
-                        escaped = re.escape(file_path) + " " + line + ":" + column + r"  \d+ sel(?:s)?(?: \(\d+\))? - " + client_name + r"@\[" + session_name + r"\] - Kakoune"
-                    else:
-                        kak_match = re.fullmatch(r"^(.+)@(.+):(.+)$", orig_prop)
-                        if kak_match:
-                            path = kak_match.group(3)
-                            app_specific\
-                                .setdefault('alacritty', []).append({
-                                    'path': path
-                                })
-
-                        # Escape special characters in swallow criteria.
-                        escaped = re.escape(orig_prop)
-                else:
+                    # Capture the state of apps which can be restored from
+                    # their title.
+                    escaped = extractors.extract(window_properties,
+                                                 app_specific)
+                if escaped is None:
                     # Escape special characters in swallow criteria.
-                    escaped = re.escape(orig_prop)
+                    escaped = re.escape(window_properties[criterion])
                 # Regex formatting.
                 value = f'^{escaped}$'
                 processed['swallows'][0][criterion] = value
 
-    # Recurse over child nodes (normal and floating).
-    for node_type in ['nodes', 'floating_nodes']:
-        if node_type in original and original[node_type] != []:
-            processed[node_type] = []
-            for child in original[node_type]:
-                # Step case.
-                processed[node_type].append(process_node(child, swallow, app_specific))
-
     return processed
 
 
+def walk(container):
+    """
+    Generator which traverses all of a container's descendants depth first,
+    visiting each container before its children and normal nodes before
+    floating nodes.
+
+    An explicit stack is used instead of recursion so that there is no limit
+    on the depth of the tree.
+
+    Args:
+        container: The container to traverse.
+
+    Yields:
+        (parent, node_type, node) tuples where node_type is either 'nodes' or
+        'floating_nodes'.
+    """
+    stack = []
+    node = container
+    while True:
+        if node:
+            # Floating nodes are pushed first so that normal nodes are visited
+            # first.
+            floating_nodes = node.get('floating_nodes')
+            if floating_nodes:
+                stack.append((node, 'floating_nodes', iter(floating_nodes)))
+            nodes = node.get('nodes')
+            if nodes:
+                stack.append((node, 'nodes', iter(nodes)))
+
+        # Find the next node, dropping lists of children that are exhausted.
+        while stack:
+            parent, node_type, children = stack[-1]
+            node = next(children, _END)
+            if node is not _END:
+                break
+            stack.pop()
+        else:
+            return
+
+        yield parent, node_type, node
+
+
+class WorkspaceIndex:
+    """
+    Index of the workspaces in a layout tree by name, number and con id, built
+    with a single pass over the outputs' content containers.
+
+    If several workspaces share a name or number, the first one in the tree is
+    indexed, which is the one a linear search would find.
+    """
+
+    def __init__(self, root):
+        self.workspaces = []
+        self.by_name = {}
+        self.by_num = {}
+        self.by_id = {}
+        for output in root.get('nodes', []):
+            for container in output.get('nodes', []):
+                # Skip dock areas, only content containers hold workspaces.
+                if container['type'] != 'con':
+                    continue
+                for ws in container.get('nodes', []):
+                    self.workspaces.append(ws)
+                    self.by_name.setdefault(ws['name'], ws)
+                    if ws.get('num') is not None:
+                        self.by_num.setdefault(ws['num'], ws)
+                    self.by_id[ws['id']] = ws
+
+    def lookup(self, workspace, numeric):
+        """
+        Look up a workspace by name, or by number if numeric is True.
+
+        Returns an empty dict if there is no such workspace.
+        """
+        if numeric:
+            if not workspace.isdigit():
+                return {}
+            return self.by_num.get(int(workspace), {})
+        return self.by_name.get(workspace, {})
+
+
+def get_workspace_index():
+    """
+    Get the workspace index for the current layout tree snapshot.
+    """
+    return session.get().get_derived('workspace_index', WorkspaceIndex)
+
+
 def get_workspace_tree(workspace, numeric):
     """
     Get full workspace layout tree from i3.
     """
-    root = json.loads(
-        subprocess.check_output(shlex.split('i3-msg -t get_tree'))
-    )
-    for output in root['nodes']:
-        for container in output['nodes']:
+    return get_workspace_index().lookup(workspace, numeric)
+
+
+def get_workspaces():
+    """
+    Get every workspace in the i3 layout tree, skipping i3's internal
+    scratchpad workspace.
+    """
+    return [
+        ws for ws in get_workspace_index().workspaces
+        if not ws['name'].startswith('__')
+    ]
+
+
+def get_focused_workspace():
+    """
+    Get the focused workspace from the i3 layout tree.
+
+    Follows the focus stack from the root down, which is much cheaper than
+    searching the whole tree for the focused window.
+    """
+    node = session.get().get_tree()
+    while node.get('type') != 'workspace':
+        focus = node.get('focus', [])
+        if focus == []:
+            return {}
+        children = itertools.chain(node.get('nodes', []),
+                                   node.get('floating_nodes', []))
+        node = next(
+            (child for child in children if child['id'] == focus[0]),
+            None,
+        )
+        if node is None:
+            return {}
+    return node
+
+
+def get_workspaces_by_focus():
+    """
+    Get every workspace ordered by how recently it was focused, skipping i3's
+    internal scratchpad workspace.
+
+    i3 only keeps focus history per output, so the workspaces visible on each
+    output come first, starting with the focused output, followed by the
+    workspaces which were visible before them and so on.
+    """
+    root = session.get().get_tree()
+    ranked = []
+    outputs = _by_focus(root.get('nodes', []), root.get('focus', []))
+    for output_rank, output in enumerate(outputs):
+        for container in output.get('nodes', []):
+            # Skip dock areas, only content containers hold workspaces.
             if container['type'] != 'con':
-                pass
-            for ws in container['nodes']:
-                # Select workspace and trigger name and num field
-                if numeric:
-                    if (workspace.isdigit()
-                            and 'num' in ws
-                            and ws['num'] == int(workspace)):
-                        return ws
-                elif ws['name'] == workspace:
-                    return ws
-    return {}
+                continue
+            workspaces = _by_focus(container.get('nodes', []),
+                                   container.get('focus', []))
+            for ws_rank, ws in enumerate(workspaces):
+                if not ws['name'].startswith('__'):
+                    ranked.append((ws_rank, output_rank, ws))
+    ranked.sort(key=lambda entry: entry[:2])
+    return [ws for _, _, ws in ranked]
+
+
+def _by_focus(nodes, focus):
+    # Sort nodes by their position in a focus stack. The sort is stable so
+    # nodes missing from the stack keep their order at the end.
+    position = {con_id: index for index, con_id in enumerate(focus)}
+    return sorted(nodes, key=lambda node: position.get(node['id'], len(focus)))
 
 
 def get_leaves(container):
     """
-    Recursive generator for retrieving a list of a container's leaf nodes.
+    Generator for retrieving a list of a container's leaf nodes.
 
     Args:
         container: The container to traverse.
     """
-    # Base cases.
-    if container is None:
-        return
-
-    nodes = container.get('nodes', []) + container.get('floating_nodes', [])
-
-    # Step case.
-    for node in nodes:
+    for _, _, node in walk(container):
         if 'window_properties' in node:
             yield node
-        yield from get_leaves(node)
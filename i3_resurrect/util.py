@@ -1,3 +1,4 @@
+import os
 import sys
 from os.path import expandvars
 from pathlib import Path
@@ -10,6 +11,14 @@ def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
+def vprint(*args, **kwargs):
+    """
+    Function for printing to stderr only in verbose mode.
+    """
+    if verbose:
+        eprint(*args, **kwargs)
+
+
 def filename_filter(filename):
     """
     Take a string and return a valid filename constructed from the string.
@@ -25,8 +34,31 @@ def filename_filter(filename):
     return filename
 
 
+def quote(string):
+    """
+    Quote a string for use as an argument in an i3 command.
+    """
+    escaped = string.replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def runtime_dir():
+    """
+    Get the user's runtime directory, which is normally on tmpfs, or None if
+    there isn't one.
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if directory is not None and os.path.isdir(directory):
+        return directory
+    return None
+
+
 def resolve_directory(directory, profile=None):
     directory = Path(expandvars(directory)).expanduser()
     if profile is not None:
         directory = directory / 'profiles'
     return directory
+
+
+# Set by the --verbose command line option.
+verbose = False
@@ -0,0 +1,232 @@
+"""
+Tracking of windows as they are opened, using i3's window events.
+"""
+import re
+import threading
+import time
+
+import i3ipc
+
+from . import trace
+from . import util
+
+
+class WindowWatcher:
+    """
+    Listens for i3 window::new events on its own connection in a background
+    thread and passes the container of every new window to its handlers.
+    """
+
+    def __init__(self):
+        self._handlers = []
+        self._connection = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def add_handler(self, handler):
+        """
+        Add a function to call with the container of each new window. It is
+        called from the watcher's thread.
+        """
+        self._handlers.append(handler)
+
+    def start(self, timeout=1.0):
+        """
+        Start listening for events.
+
+        Waits until i3 has confirmed the subscription so that no window opened
+        after this returns is missed. Returns whether the watcher started.
+        """
+        try:
+            self._connection = i3ipc.Connection()
+        except Exception as e:
+            util.eprint(f'Could not watch for new windows: {e}')
+            return False
+        self._connection.on(i3ipc.Event.WINDOW_NEW, self._on_window_new)
+        # i3 sends a tick event as soon as it's subscribed to, which tells us
+        # that the subscription is in place.
+        self._connection.on(i3ipc.Event.TICK, self._on_tick)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._ready.wait(timeout)
+
+    def stop(self):
+        """
+        Stop listening for events.
+        """
+        if self._connection is not None:
+            self._connection.main_quit()
+        if self._thread is not None:
+            self._thread.join(1.0)
+        self._connection = None
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _run(self):
+        try:
+            self._connection.main()
+        except Exception:
+            # The socket is shut down under the main loop when stopping.
+            pass
+
+    def _on_tick(self, connection, event):
+        self._ready.set()
+
+    def _on_window_new(self, connection, event):
+        container = event.ipc_data['container']
+        window_properties = container.get('window_properties', {})
+        trace.instant('window::new', 'window', id=container['id'],
+                      window_class=window_properties.get('class'),
+                      title=window_properties.get('title'))
+        # Handlers can be added while the watcher is running.
+        for handler in list(self._handlers):
+            handler(container)
+
+
+class SwallowTracker:
+    """
+    Keeps track of placeholder windows until programs' windows are swallowed
+    by them.
+
+    i3 reuses a placeholder's container for the window which it swallows, so
+    placeholders are matched to new windows by container id.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        # Maps the container ids of the placeholders which haven't been filled
+        # yet to their swallow criteria and when they started waiting.
+        self._pending = {}
+        # (criteria, latency in seconds) for each filled placeholder.
+        self.swallowed = []
+        # The window properties of new windows which didn't fill a
+        # placeholder, keyed by window id.
+        self.unexpected = {}
+        # The ids of windows which are known to open again, such as those
+        # remapped when restoring a layout.
+        self._ignored = set()
+
+    def add(self, placeholders):
+        """
+        Start tracking placeholder containers from the layout tree.
+        """
+        now = time.perf_counter()
+        with self._condition:
+            for placeholder in placeholders:
+                self._pending[placeholder['id']] = (
+                    placeholder.get('swallows', []),
+                    now,
+                )
+
+    def discard(self, placeholders):
+        """
+        Stop tracking placeholder containers, such as those whose programs
+        weren't launched.
+        """
+        with self._condition:
+            for placeholder in placeholders:
+                self._pending.pop(placeholder['id'], None)
+            if self._pending == {}:
+                self._condition.notify_all()
+
+    def ignore(self, window_ids):
+        """
+        Don't report windows as opened outside of a placeholder, because they
+        are existing windows which were remapped.
+        """
+        with self._condition:
+            self._ignored.update(window_ids)
+            # Their windows may already have been seen.
+            for window_id in window_ids:
+                self.unexpected.pop(window_id, None)
+
+    def window_opened(self, container):
+        """
+        Record a new window. Called by the window watcher.
+        """
+        now = time.perf_counter()
+        with self._condition:
+            entry = self._pending.pop(container['id'], None)
+            if entry is None:
+                window_id = container.get('window')
+                if window_id not in self._ignored:
+                    self.unexpected[window_id] = container.get(
+                        'window_properties', {})
+                return
+            criteria, started = entry
+            self.swallowed.append((criteria, now - started))
+            trace.complete('swallow', started, now, 'window',
+                           criteria=format_criteria(criteria))
+            if self._pending == {}:
+                self._condition.notify_all()
+
+    def wait(self, timeout):
+        """
+        Wait until every placeholder has been filled or the timeout is reached.
+
+        Returns whether every placeholder was filled.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == {},
+                                            timeout)
+
+    def report(self):
+        """
+        Print how long each window took to be swallowed, and the placeholders
+        which were never filled.
+        """
+        with self._condition:
+            for criteria, latency in sorted(self.swallowed,
+                                            key=lambda entry: entry[1]):
+                util.vprint(f'Swallowed {format_criteria(criteria)} in '
+                            f'{latency * 1000:.0f} ms')
+            for window_properties in self.unexpected.values():
+                util.vprint('Opened outside of a placeholder: '
+                            f'{format_criteria([window_properties])}')
+            pending = [criteria for criteria, _ in self._pending.values()]
+        if pending != []:
+            util.eprint(f'{len(pending)} placeholder(s) were not swallowed:')
+            for criteria in pending:
+                util.eprint(f'  {format_criteria(criteria)}')
+
+
+def get_unlaunched(placeholders, window_classes):
+    """
+    Get the placeholders which can't be filled by a window of any of the
+    classes of the windows which were launched.
+
+    Placeholders whose criteria don't match on the class are assumed to be
+    fillable by anything.
+    """
+    unlaunched = []
+    for placeholder in placeholders:
+        for match in placeholder.get('swallows', []):
+            pattern = match.get('class')
+            if pattern is None:
+                break
+            try:
+                if any(re.search(pattern, window_class)
+                       for window_class in window_classes):
+                    break
+            except re.error:
+                break
+        else:
+            unlaunched.append(placeholder)
+    return unlaunched
+
+
+def format_criteria(criteria):
+    """
+    Format a list of swallow criteria for printing.
+    """
+    return ' or '.join(
+        '[' + ' '.join(f'{key}="{value}"' for key, value in match.items()
+                       if key in ['class', 'instance', 'title',
+                                  'window_role']) + ']'
+        for match in criteria
+    )
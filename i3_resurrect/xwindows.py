@@ -0,0 +1,329 @@
+"""
+Batched operations on X windows.
+
+Operations on many windows are done over a single X connection using
+python-xlib if it is available, or otherwise with a single chained xdotool
+command, instead of spawning a process for every window.
+"""
+import re
+import subprocess
+import time
+
+try:
+    from Xlib import X
+    from Xlib import Xatom
+    from Xlib import display as xdisplay
+    from Xlib import error as xerror
+    from Xlib.protocol import request as xrequest
+except ImportError:
+    xdisplay = None
+
+from . import util
+
+# The properties which PropertyReader reads.
+PID_PROPERTY = '_NET_WM_PID'
+CLASS_PROPERTY = 'WM_CLASS'
+NAME_PROPERTIES = ['_NET_WM_NAME', 'WM_NAME']
+
+
+class WindowOps:
+    """
+    Maps, unmaps and kills X windows in batches.
+
+    Errors for windows which no longer exist are ignored, like they are when
+    running xdotool for each window.
+    """
+
+    def __init__(self):
+        self.display = _open_display()
+
+    @property
+    def backend(self):
+        """
+        The name of the backend in use.
+        """
+        return 'xlib' if self.display is not None else 'xdotool'
+
+    def unmap(self, window_ids):
+        """
+        Unmap windows.
+        """
+        self._run('unmap', 'windowunmap', window_ids)
+
+    def map(self, window_ids):
+        """
+        Map windows.
+        """
+        self._run('map', 'windowmap', window_ids)
+
+    def kill(self, window_ids):
+        """
+        Kill the clients which own windows.
+        """
+        self._run('kill_client', 'windowkill', window_ids)
+
+    def close(self):
+        """
+        Close the X connection.
+        """
+        if self.display is not None:
+            try:
+                self.display.close()
+            except xerror.ConnectionClosedError:
+                pass
+            self.display = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self, method, xdo_command, window_ids):
+        window_ids = list(window_ids)
+        if window_ids == []:
+            return
+        if self.display is not None:
+            try:
+                for window_id in window_ids:
+                    window = self.display.create_resource_object(
+                        'window',
+                        window_id,
+                    )
+                    getattr(window, method)()
+                # Wait until the X server has processed every request, so that
+                # the windows are in the expected state when we carry on.
+                self.display.sync()
+                return
+            except xerror.ConnectionClosedError:
+                # Fall back to xdotool so that no window is left unmapped.
+                self.display = None
+        _xdo_batch(xdo_command, window_ids)
+
+
+class PropertyReader:
+    """
+    Reads the PIDs, and optionally the classes and titles, of X windows in a
+    batch.
+
+    With python-xlib the requests for every window are sent before waiting
+    for any of the replies, so a batch takes a single round trip to the X
+    server. Otherwise a single shell runs xprop for each window.
+    """
+
+    def __init__(self):
+        self.display = _open_display()
+
+    @property
+    def backend(self):
+        """
+        The name of the backend in use.
+        """
+        return 'xlib' if self.display is not None else 'xprop'
+
+    def read(self, window_ids, names=False):
+        """
+        Read the properties of windows.
+
+        Args:
+            window_ids: The ids of the windows.
+            names: Whether to read the class, instance and title of each window
+                as well as its PID.
+
+        Returns:
+            A dict mapping each window id to a dict with its 'pid', which is 0
+            if it isn't known, and if names is True the 'class', 'instance'
+            and 'title' which the window has.
+        """
+        window_ids = list(window_ids)
+        if window_ids == []:
+            return {}
+        start = time.perf_counter()
+        properties = None
+        if self.display is not None:
+            try:
+                properties = self._read_xlib(window_ids, names)
+            except xerror.ConnectionClosedError:
+                self.display = None
+        if properties is None:
+            properties = _read_xprop(window_ids, names)
+        elapsed = (time.perf_counter() - start) * 1000
+        util.vprint(f'Read the properties of {len(window_ids)} windows '
+                    f'({self.backend}) in {elapsed:.1f} ms')
+        return properties
+
+    def close(self):
+        """
+        Close the X connection.
+        """
+        if self.display is not None:
+            try:
+                self.display.close()
+            except xerror.ConnectionClosedError:
+                pass
+            self.display = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_xlib(self, window_ids, names):
+        property_names = [PID_PROPERTY]
+        if names:
+            property_names += [CLASS_PROPERTY] + NAME_PROPERTIES
+        atoms = {
+            name: self.display.intern_atom(name) for name in property_names
+        }
+        # Send every request first and only then wait for the replies.
+        requests = [
+            (window_id, name, xrequest.GetProperty(
+                display=self.display.display,
+                defer=True,
+                delete=False,
+                window=window_id,
+                property=atoms[name],
+                type=X.AnyPropertyType,
+                long_offset=0,
+                long_length=1024,
+            ))
+            for window_id in window_ids
+            for name in property_names
+        ]
+        values = {window_id: {} for window_id in window_ids}
+        for window_id, name, reply in requests:
+            try:
+                reply.reply()
+            except xerror.XError:
+                # The window no longer exists.
+                continue
+            if reply.property_type == X.NONE:
+                continue
+            _, value = reply.value
+            if reply.property_type == Xatom.CARDINAL:
+                values[window_id][name] = list(value)
+            else:
+                if isinstance(value, bytes):
+                    value = value.decode('utf-8', errors='replace')
+                values[window_id][name] = value.split('\0')
+        return {
+            window_id: _window_properties(window_values, names)
+            for window_id, window_values in values.items()
+        }
+
+
+def _read_xprop(window_ids, names):
+    # xprop only reads a single window at a time, so run it for every window
+    # from a single shell rather than starting a process from here for each
+    # one, ending the output for each window with a line holding a dot.
+    property_names = [PID_PROPERTY]
+    if names:
+        property_names += [CLASS_PROPERTY] + NAME_PROPERTIES
+    script = ('for id; do xprop -id "$id" ' + ' '.join(property_names)
+              + ' 2>/dev/null; echo .; done')
+    try:
+        output = subprocess.run(
+            ['sh', '-c', script, 'sh'] + [str(w) for w in window_ids],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.decode('utf-8', errors='replace')
+    except OSError:
+        output = ''
+    outputs = [[]]
+    for line in output.splitlines():
+        if line == '.':
+            outputs.append([])
+        else:
+            outputs[-1].append(line)
+    return {
+        window_id: _window_properties(
+            parse_xprop('\n'.join(outputs[index])
+                        if index < len(outputs) else ''),
+            names,
+        )
+        for index, window_id in enumerate(window_ids)
+    }
+
+
+def parse_xprop(output):
+    """
+    Parse the output of xprop for a single window.
+
+    Returns a dict mapping each property which was found to a list of its
+    values, which are ints for numeric properties and strings otherwise.
+    """
+    values = {}
+    for line in output.splitlines():
+        match = _XPROP_LINE.match(line)
+        if match is None:
+            continue
+        name, value = match.groups()
+        strings = _XPROP_STRING.findall(value)
+        if strings != []:
+            values[name] = [_XPROP_ESCAPE.sub(r'\1', s) for s in strings]
+        else:
+            try:
+                values[name] = [int(v) for v in value.split(',')]
+            except ValueError:
+                continue
+    return values
+
+
+def _window_properties(values, names):
+    pid = values.get(PID_PROPERTY, [0])
+    properties = {'pid': pid[0] if pid != [] else 0}
+    if names:
+        # WM_CLASS holds the instance followed by the class.
+        wm_class = values.get(CLASS_PROPERTY, [])
+        if len(wm_class) >= 2:
+            properties['instance'] = wm_class[0]
+            properties['class'] = wm_class[1]
+        for name in NAME_PROPERTIES:
+            if values.get(name):
+                properties['title'] = values[name][0]
+                break
+    return properties
+
+
+def _open_display():
+    if xdisplay is None:
+        return None
+    try:
+        display = xdisplay.Display()
+    except (xerror.DisplayError, xerror.ConnectionClosedError):
+        return None
+    display.set_error_handler(_ignore_error)
+    return display
+
+
+def _xdo_batch(command, window_ids):
+    # Chain the command for every window in a single xdotool process.
+    chained = []
+    for window_id in window_ids:
+        chained += [command, str(window_id)]
+    returncode = subprocess.call(
+        ['xdotool'] + chained,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+    )
+    if returncode != 0:
+        # xdotool stops at the first failing command in a chain, so run each
+        # one separately to make sure they are all attempted.
+        for window_id in window_ids:
+            subprocess.call(
+                ['xdotool', command, str(window_id)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.STDOUT,
+            )
+
+
+def _ignore_error(error, request):
+    pass
+
+
+# Matches a property line of xprop's output, such as
+# 'WM_CLASS(STRING) = "instance", "Class"'.
+_XPROP_LINE = re.compile(r'([A-Z_]+)\([A-Z0-9_]+\) = (.*)')
+_XPROP_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_XPROP_ESCAPE = re.compile(r'\\(.)')
@@ -1,3 +1,17 @@
+from . import test_apps
+from . import test_extractors
+from . import test_kakoune
+from . import test_launcher
 from . import test_layout
+from . import test_main
+from . import test_processes
 from . import test_programs
+from . import test_readiness
+from . import test_restorers
+from . import test_scheduler
+from . import test_session
+from . import test_storage
+from . import test_trace
 from . import test_treeutils
+from . import test_watch
+from . import test_xwindows
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import Counter
+
+from i3_resurrect import apps
+from i3_resurrect import config
+from i3_resurrect import extractors
+from i3_resurrect import restorers
+from i3_resurrect import session
+
+
+class FakeSession:
+    def __init__(self, tree):
+        self.tree = tree
+        self.derived = {}
+
+    def get_tree(self):
+        return self.tree
+
+    def get_derived(self, key, build):
+        return self.derived.setdefault(key, build(self.tree))
+
+
+def window(title, window_class):
+    return {
+        'type': 'con',
+        'window_properties': {'class': window_class, 'title': title},
+        'nodes': [],
+    }
+
+
+def test_get_live_apps(monkeypatch):
+    workspaces = [
+        ('1', [window('user@host:~/code', 'Alacritty'),
+               window('main.py 10:5  1 sel - client0@[proj] - Kakoune',
+                      'Alacritty')]),
+        ('_load_1', [window('user@host:~/code', 'Alacritty')]),
+        ('2', [window('user@host:~', 'Alacritty'),
+               window('a.py 1:1 [+] 2 sels - client1@[proj] - Kakoune',
+                      'Alacritty')]),
+    ]
+    tree = {
+        'type': 'root',
+        'nodes': [{
+            'type': 'output',
+            'nodes': [{
+                'type': 'con',
+                'nodes': [
+                    {'id': index, 'type': 'workspace', 'name': name,
+                     'nodes': windows}
+                    for index, (name, windows) in enumerate(workspaces)
+                ],
+            }],
+        }],
+    }
+    monkeypatch.setattr(session, '_session', FakeSession(tree))
+    monkeypatch.setattr(apps.kakoune, 'list_sessions', lambda: {'proj'})
+    monkeypatch.setattr(config, '_config', {})
+    monkeypatch.setattr(extractors, '_by_class', None)
+
+    # Terminals in other workspaces don't count, but Kakoune clients do.
+    assert apps.get_live_apps('1') == {
+        'kakoune_sessions': {'proj'},
+        'kakoune_clients': {('proj', 'client0'), ('proj', 'client1')},
+        'alacritty': Counter({'~/code': 2}),
+    }
+
+
+def test_get_missing_apps():
+    saved_apps = {
+        'kakoune_sessions': {
+            'proj': {
+                'server_working_directory': '~/proj',
+                'clients': {'client0': {}, 'client1': {}},
+            },
+            'notes': {
+                'server_working_directory': '~/notes',
+                'clients': {'client0': {}},
+            },
+            'idle': {
+                'server_working_directory': '~',
+                'clients': {'client0': {}},
+            },
+        },
+        'alacritty': [{'path': '~'}, {'path': '~/code'}, {'path': '~/code'}],
+    }
+    live_apps = {
+        'kakoune_sessions': {'proj', 'idle'},
+        'kakoune_clients': {('proj', 'client0'), ('idle', 'client0')},
+        'alacritty': Counter({'~/code': 1, '/tmp': 1}),
+    }
+
+    assert apps.get_missing_apps(saved_apps, live_apps) == {
+        'kakoune_sessions': {
+            'proj': {
+                'server_working_directory': '~/proj',
+                'clients': {'client1': {}},
+            },
+            'notes': {
+                'server_working_directory': '~/notes',
+                'clients': {'client0': {}},
+            },
+        },
+        'kakoune_servers': ['notes'],
+        'alacritty': [{'path': '~'}, {'path': '~/code'}],
+        'alacritty_running': True,
+    }
+
+
+def test_terminals(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def run_terminal(first_terminal, socket_path, extra_args,
+                     app_launcher=None):
+        if first_terminal:
+            time.sleep(0.05)
+        with lock:
+            calls.append((first_terminal, extra_args))
+        return False
+
+    monkeypatch.setattr(apps, 'run_terminal', run_terminal)
+    terminals = apps.Terminals('/tmp/socket', False, None)
+    threads = [
+        threading.Thread(target=terminals.open, args=([str(index)],))
+        for index in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Only one window starts the instance, and the others wait for it.
+    assert len(calls) == 4
+    assert calls[0][0] is True
+    assert [first for first, _ in calls[1:]] == [False, False, False]
+
+
+def test_kakoune_clients_per_session(monkeypatch):
+    opened = []
+
+    class Terminals:
+        def open(self, extra_args):
+            opened.append(extra_args[-1].split()[2])
+
+    def wait_for_kakoune_sessions(session_names):
+        assert session_names == ['first', 'second']
+        yield 'first'
+        # The clients of the first session are opened before the second
+        # session is ready.
+        assert opened == ['running', 'first']
+        yield 'second'
+
+    monkeypatch.setattr(apps, 'wait_for_kakoune_sessions',
+                        wait_for_kakoune_sessions)
+    client = {'client0': {'path': '~/file', 'line': 1, 'column': 1}}
+    context = restorers.Context({
+        'kakoune_sessions': {
+            name: {'server_working_directory': '~', 'clients': client}
+            for name in ['running', 'first', 'second']
+        },
+        'kakoune_servers': ['first', 'second'],
+    }, '1', None)
+    context.state['terminals'] = Terminals()
+
+    assert apps._launch_kakoune_clients(context)
+    assert opened == ['running', 'first', 'second']
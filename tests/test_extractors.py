@@ -0,0 +1,99 @@
+import re
+
+from i3_resurrect import config
+from i3_resurrect import extractors
+
+
+def test_extract(monkeypatch):
+    monkeypatch.setattr(config, '_config', {})
+    monkeypatch.setattr(extractors, '_by_class', None)
+    app_specific = {}
+
+    # Test Kakoune client title.
+    kakoune = {
+        'class': 'Alacritty',
+        'title': 'src/main.py 12:4 [+] 1 sel - client0@[project] - Kakoune',
+    }
+    swallow = extractors.extract(kakoune, app_specific)
+    assert app_specific['kakoune_sessions'] == {
+        'project': {
+            'clients': {
+                'client0': {'path': 'src/main.py', 'line': '12', 'column': '4'},
+            },
+        },
+    }
+    # The swallow regex should match the unmodified buffer after restoring.
+    assert re.fullmatch(
+        swallow,
+        'src/main.py 12:4  3 sels (2) - client0@[project] - Kakoune',
+    )
+
+    # Test Alacritty shell title.
+    alacritty = {
+        'class': 'Alacritty',
+        'title': 'user@host:~/src',
+    }
+    assert extractors.extract(alacritty, app_specific) is None
+    assert app_specific['alacritty'] == [{'path': '~/src'}]
+
+    # Test title which no extractor matches.
+    other = {
+        'class': 'Firefox',
+        'title': 'Mozilla Firefox',
+    }
+    assert extractors.extract(other, app_specific) is None
+    # Shell-like titles of other windows, such as browser tabs, aren't taken
+    # for terminals.
+    mail = {
+        'class': 'Thunderbird',
+        'title': 'Re: meeting - user@example.com: Inbox',
+    }
+    assert extractors.extract(mail, app_specific) is None
+    assert app_specific['alacritty'] == [{'path': '~/src'}]
+    assert list(app_specific) == ['kakoune_sessions', 'alacritty']
+
+    # The terminal classes come from the config.
+    monkeypatch.setattr(config, '_config', {'terminals': ['Xterm']})
+    monkeypatch.setattr(extractors, '_by_class', None)
+    xterm = {
+        'class': 'Xterm',
+        'title': 'user@host:/tmp',
+    }
+    extractors.extract(xterm, app_specific)
+    assert app_specific['alacritty'][-1] == {'path': '/tmp'}
+
+    # Test extractor restricted to a window class.
+    monkeypatch.setattr(extractors, '_extractors', list(extractors._extractors))
+    monkeypatch.setattr(extractors, '_any_class', [])
+    extractors.register(extractors.Extractor(
+        'firefox',
+        r'(.+) — Mozilla Firefox',
+        lambda match, state: state.setdefault('firefox', match.group(1)),
+        classes=['Firefox'],
+    ))
+    firefox = {
+        'class': 'Firefox',
+        'title': 'Example — Mozilla Firefox',
+    }
+    extractors.extract(firefox, app_specific)
+    assert app_specific['firefox'] == 'Example'
+    not_firefox = {
+        'class': 'Chromium',
+        'title': 'Other — Mozilla Firefox',
+    }
+    extractors.extract(not_firefox, app_specific)
+    assert app_specific['firefox'] == 'Example'
+
+    # Test extractor restricted to a window instance.
+    extractors.register(extractors.Extractor(
+        'scratchpad',
+        r'(.+)',
+        lambda match, state: state.setdefault('scratchpad', match.group(1)),
+        instances=['scratchpad'],
+    ))
+    extractors.extract({'class': 'URxvt', 'instance': 'urxvt',
+                        'title': 'Other'}, app_specific)
+    assert 'scratchpad' not in app_specific
+    extractors.extract({'class': 'URxvt', 'instance': 'scratchpad',
+                        'title': 'Notes'}, app_specific)
+    assert app_specific['scratchpad'] == 'Notes'
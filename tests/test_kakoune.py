@@ -0,0 +1,78 @@
+import os
+import threading
+
+from i3_resurrect import kakoune
+
+
+class FakeKak:
+    """
+    Stands in for `kak -p <session>`, running the shell expansion in the
+    command it is sent from the session's working directory.
+    """
+    sessions = {}
+
+    def __init__(self, args):
+        self.session_name = args[2]
+        self.stdin = self
+
+    def write(self, command):
+        self.command = command
+
+    def close(self):
+        working_directory = self.sessions.get(self.session_name)
+        if working_directory is None:
+            return
+        script = self.command[self.command.index('%sh{') + 4:-1]
+        # Reply in the background like a real session would.
+        threading.Timer(
+            0.05,
+            os.system,
+            [f'cd "{working_directory}" && {script}'],
+        ).start()
+
+    def wait(self, timeout=None):
+        return 0 if self.session_name in self.sessions else 255
+
+
+def test_get_working_directories(monkeypatch, tmp_path):
+    (tmp_path / 'project one').mkdir()
+    (tmp_path / 'project2').mkdir()
+    monkeypatch.setattr(FakeKak, 'sessions', {
+        'one': str(tmp_path / 'project one'),
+        'two': str(tmp_path / 'project2'),
+    })
+    popen = kakoune.subprocess.Popen
+    monkeypatch.setattr(
+        kakoune.subprocess,
+        'Popen',
+        lambda args, **kwargs: (FakeKak(args) if args[0] == 'kak'
+                                else popen(args, **kwargs)),
+    )
+
+    working_directories = kakoune.get_working_directories(
+        ['one', 'dead', 'two'],
+        5,
+    )
+    assert working_directories == {
+        'one': str(tmp_path / 'project one'),
+        'two': str(tmp_path / 'project2'),
+    }
+
+
+def test_iter_ready_sessions(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    socket_dir = tmp_path / 'kakoune'
+    assert kakoune.get_socket_dir() == str(socket_dir)
+    monkeypatch.setattr(kakoune, 'list_sessions', lambda: {'elsewhere'})
+
+    def start_server(session_name):
+        socket_dir.mkdir(exist_ok=True)
+        (socket_dir / session_name).touch()
+
+    # Sessions are yielded in the order their sockets appear, followed by
+    # those which are running but whose sockets weren't found.
+    threading.Timer(0.1, start_server, ['one']).start()
+    threading.Timer(0.02, start_server, ['two']).start()
+    ready = kakoune.iter_ready_sessions(['one', 'two', 'elsewhere', 'dead'],
+                                       0.5)
+    assert list(ready) == ['two', 'one', 'elsewhere']
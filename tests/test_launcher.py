@@ -0,0 +1,64 @@
+import os
+
+from i3_resurrect import launcher
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.admitted = 0
+        self.released = []
+
+    def admit(self, launch):
+        self.admitted += 1
+        return 0.0
+
+    def release(self, launch):
+        self.released.append(launch.command)
+
+    def wrap(self, command):
+        return ['env', 'WRAPPED=1'] + command
+
+
+def test_launcher(tmp_path):
+    scheduler = FakeScheduler()
+    launches = launcher.Launcher(scheduler)
+    script = 'echo "$(pwd) $FOO $WRAPPED" > out'
+
+    # The working directory and environment are per program, and started
+    # programs are wrapped by the scheduler.
+    cwd = os.getcwd()
+    process = launches.start(['sh', '-c', script], cwd=tmp_path,
+                             env={'FOO': 'bar'})
+    assert process.wait() == 0
+    assert os.getcwd() == cwd
+    assert (tmp_path / 'out').read_text() == f'{tmp_path} bar 1\n'
+
+    assert launches.run(['sh', '-c', script], cwd=tmp_path,
+                        admit=False) == 0
+    assert (tmp_path / 'out').read_text() == f'{tmp_path}  \n'
+    assert launches.run(['sh', '-c', 'exit 3']) == 3
+    assert scheduler.admitted == 2
+
+    assert all(launch.duration >= 0 for launch in launches.launches)
+
+    # Programs which can't be started are reported rather than raising, and
+    # don't count as pending.
+    launches = launcher.Launcher(scheduler)
+    assert launches.start(['true'], cwd=tmp_path / 'missing') is None
+    assert launches.run(['/nonexistent/program']) is None
+    assert launches.run(['/nonexistent/other'], admit=False) is None
+    assert all(launch.error is not None for launch in launches.launches)
+    assert scheduler.released == [['true'], ['/nonexistent/program']]
+
+
+def test_submit(tmp_path):
+    with launcher.Launcher(max_workers=4) as launches:
+        futures = [
+            launches.submit(launches.run,
+                            ['sh', '-c', f'sleep 0.1; touch {index}'],
+                            cwd=tmp_path)
+            for index in range(4)
+        ]
+    assert [future.result() for future in futures] == [0, 0, 0, 0]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['0', '1', '2', '3']
+    assert len(launches.launches) == 4
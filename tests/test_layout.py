@@ -1,3 +1,6 @@
+import json
+import os
+
 from i3_resurrect import config
 from i3_resurrect import layout
 
@@ -324,6 +327,7 @@ def test_build_layout(monkeypatch):
                 "orientation": "none",
                 "percent": 0.5,
                 "scratchpad_state": "none",
+                "title_format": " %title ",
                 "type": "con",
                 "workspace_layout": "default",
                 "swallows": [
@@ -370,6 +374,7 @@ def test_build_layout(monkeypatch):
                         "orientation": "none",
                         "percent": 0.5,
                         "scratchpad_state": "none",
+                        "title_format": " %title ",
                         "sticky": False,
                         "type": "con",
                         "workspace_layout": "default",
@@ -397,6 +402,7 @@ def test_build_layout(monkeypatch):
                         "orientation": "none",
                         "percent": 0.5,
                         "scratchpad_state": "none",
+                        "title_format": " %title ",
                         "sticky": False,
                         "type": "con",
                         "workspace_layout": "default",
@@ -414,3 +420,131 @@ def test_build_layout(monkeypatch):
     }
     tree = layout.build_layout(workspace_container, ['class', 'instance', 'title'])
     assert tree == expected_tree
+
+
+def test_save_unchanged(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, '_config', {})
+
+    workspace_tree = {
+        'type': 'workspace',
+        'name': '1',
+        'layout': 'splith',
+        'nodes': [
+            {
+                'type': 'con',
+                'name': 'Ario',
+                'window_properties': {'class': 'Ario', 'instance': 'ario'},
+                'nodes': [],
+            },
+        ],
+    }
+    layout_file = tmp_path / 'workspace_1_layout.json'
+
+    assert layout.save('1', False, tmp_path, None, ['class'], workspace_tree)
+    assert layout_file.is_file()
+    assert (tmp_path / 'workspace_1_apps.json').is_file()
+
+    # Saving again without any changes doesn't write anything.
+    layout_file.write_text('{}')
+    assert not layout.save('1', False, tmp_path, None, ['class'],
+                           workspace_tree)
+    assert layout_file.read_text() == '{}'
+
+    # Unless forced to.
+    assert layout.save('1', False, tmp_path, None, ['class'], workspace_tree,
+                       force=True)
+    assert layout_file.read_text() != '{}'
+
+    # Changes to the layout are saved.
+    workspace_tree['layout'] = 'tabbed'
+    assert layout.save('1', False, tmp_path, None, ['class'], workspace_tree)
+    assert layout.read('1', tmp_path, None)['layout'] == 'tabbed'
+
+    # So are changes to how the files are written.
+    monkeypatch.setattr(config, '_config', {'compact_layouts': True})
+    assert layout.save('1', False, tmp_path, None, ['class'], workspace_tree)
+    assert '\n' not in layout_file.read_text().strip()
+    assert not layout.save('1', False, tmp_path, None, ['class'],
+                           workspace_tree)
+
+    # Missing files are always written.
+    layout_file.unlink()
+    assert layout.save('1', False, tmp_path, None, ['class'], workspace_tree)
+    assert layout_file.is_file()
+
+
+def test_payload(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, '_config', {})
+
+    workspace_tree = {
+        'type': 'workspace',
+        'name': '1',
+        'layout': 'splith',
+        'nodes': [
+            {
+                'type': 'con',
+                'name': 'Ario',
+                'window_properties': {'class': 'Ario', 'instance': 'ario'},
+                'nodes': [],
+            },
+        ],
+        'floating_nodes': [
+            {
+                'type': 'floating_con',
+                'rect': {'x': 0, 'y': 0, 'width': 10, 'height': 10},
+                'nodes': [],
+            },
+        ],
+    }
+    layout.save('1', False, tmp_path, None, ['class'], workspace_tree)
+
+    # The saved payload contains the workspace's children.
+    payload_file = layout.read_payload('1', tmp_path, None)
+    saved_layout = layout.read('1', tmp_path, None)
+    assert payload_file.read_text() == layout.build_payload(saved_layout)
+    assert json.loads(payload_file.read_text()) == [[
+        {'name': 'Ario', 'swallows': [{'class': '^Ario$'}]},
+        {'type': 'floating_con',
+         'rect': {'x': 0, 'y': 0, 'width': 10, 'height': 10}},
+    ]]
+
+    # The payload isn't used if the layout was modified after saving.
+    layout_file = tmp_path / 'workspace_1_layout.json'
+    mtime = payload_file.stat().st_mtime
+    os.utime(layout_file, (mtime + 1, mtime + 1))
+    assert layout.read_payload('1', tmp_path, None) is None
+    assert layout.read_payload('2', tmp_path, None) is None
+
+
+def test_restore_commands(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, '_config', {})
+
+    for name in ['1', 'mail/web']:
+        layout.save(name, False, tmp_path, None, ['class'],
+                    {'type': 'workspace', 'name': name, 'layout': 'tabbed',
+                     'nodes': []})
+    # A workspace saved by number is saved under its number rather than its
+    # name.
+    layout.save('3', True, tmp_path, None, ['class'],
+                {'type': 'workspace', 'name': '3: web', 'num': 3,
+                 'nodes': []})
+    (tmp_path / 'workspace_2_layout.json').write_text('not json')
+
+    assert sorted(layout.get_saved_workspaces(tmp_path)) == [
+        ('1', '1'),
+        ('3', '3: web'),
+        ('mailweb', 'mail/web'),
+    ]
+    assert layout.read('3', tmp_path, None)['name'] == '3: web'
+
+    # Unreadable layouts can be skipped instead of exiting.
+    assert layout.read('2', tmp_path, None, required=False) is None
+    assert layout.read('4', tmp_path, None, required=False) is None
+
+    saved_layout = layout.read('mail/web', tmp_path, None)
+    payload_file = layout.read_payload('mail/web', tmp_path, None)
+    assert layout.restore_commands('mail/web', saved_layout, payload_file) == [
+        'workspace --no-auto-back-and-forth "mail/web"',
+        'layout tabbed',
+        f'append_layout "{payload_file}"',
+    ]
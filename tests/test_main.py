@@ -0,0 +1,184 @@
+from types import SimpleNamespace
+
+from click.testing import CliRunner
+
+from i3_resurrect import config
+from i3_resurrect import launcher
+from i3_resurrect import layout
+from i3_resurrect import main
+from i3_resurrect import session
+
+
+class FakeSession:
+    def __init__(self, tree):
+        self.tree = tree
+        self.derived = {}
+        self.commands = []
+
+    def get_tree(self):
+        return self.tree
+
+    def get_derived(self, key, build):
+        return self.derived.setdefault(key, build(self.tree))
+
+    def invalidate(self):
+        self.derived.clear()
+
+    def command(self, payload):
+        self.commands += payload.split(';')
+        return [SimpleNamespace(success=True, error=None)
+                for _ in payload.split(';')]
+
+    def batch(self):
+        return session.CommandBatch(self)
+
+
+def test_restore_all_workspaces(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(config, '_config', {})
+    layout.save('3', True, tmp_path, None, ['class'],
+                {'type': 'workspace', 'name': '3: web', 'num': 3,
+                 'layout': 'tabbed', 'nodes': []})
+    layout.save('4', False, tmp_path, None, ['class'],
+                {'type': 'workspace', 'name': '4', 'nodes': []})
+    (tmp_path / 'workspace_5_layout.json').write_text('not json')
+    # Only the numbered workspace exists, so it's restored first.
+    tree = {
+        'type': 'root',
+        'id': 1,
+        'focus': [2],
+        'nodes': [{
+            'type': 'output',
+            'id': 2,
+            'focus': [3],
+            'nodes': [{
+                'type': 'con',
+                'id': 3,
+                'focus': [4],
+                'nodes': [{'type': 'workspace', 'id': 4, 'name': '3: web',
+                           'num': 3, 'nodes': []}],
+            }],
+        }],
+    }
+    i3 = FakeSession(tree)
+    monkeypatch.setattr(session, '_session', i3)
+
+    # Files are read by the workspace ids in their names and the saved names
+    # are only used for the workspace commands.
+    main.restore_all_workspaces(tmp_path, 'layout_only')
+    payload_file = layout.get_payload_file(tmp_path
+                                           / 'workspace_3_layout.json')
+    assert 'workspace --no-auto-back-and-forth "3: web"' in i3.commands
+    assert f'append_layout "{payload_file}"' in i3.commands
+    assert i3.commands[-1] == 'workspace --no-auto-back-and-forth "3: web"'
+    assert 'Restored 1 more layouts' in capsys.readouterr().out
+
+    # A workspace whose layout disappeared is skipped instead of exiting.
+    monkeypatch.setattr(layout, 'get_saved_workspaces',
+                        lambda directory: [('4', '4'), ('6', '6')])
+    i3.commands.clear()
+    main.restore_all_workspaces(tmp_path, 'layout_only')
+    assert 'workspace --no-auto-back-and-forth "4"' in i3.commands
+    assert not any('"6"' in command for command in i3.commands)
+    output = capsys.readouterr()
+    assert 'Restored 0 more layouts' in output.out
+    assert 'Restored 1 workspaces' in output.out
+    assert 'Skipped 1 workspaces' in output.err
+
+    # The programs of every workspace are launched with the same launcher
+    # and watcher.
+    calls = []
+
+    def restore_apps(workspace, workspace_name, directory, profile,
+                     app_launcher, watcher=None):
+        calls.append((workspace, app_launcher, watcher))
+        return set()
+
+    monkeypatch.setattr(main.apps, 'restore', restore_apps)
+    for workspace_id in ['3', '4']:
+        (tmp_path / f'workspace_{workspace_id}_apps.json').write_text('{}')
+    monkeypatch.setattr(layout, 'get_saved_workspaces',
+                        lambda directory: [('3', '3: web'), ('4', '4')])
+    app_launcher = launcher.Launcher()
+    watcher = object()
+    main.restore_all_workspaces(tmp_path, 'programs_only', app_launcher,
+                                watcher)
+    assert calls == [
+        ('3', app_launcher, watcher),
+        ('4', app_launcher, watcher),
+    ]
+
+
+def test_save_all_workspaces(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, '_config', {})
+
+    def workspace(con_id, name, windows):
+        return {'id': con_id, 'type': 'workspace', 'name': name,
+                'layout': 'splith', 'nodes': windows, 'floating_nodes': []}
+
+    ario = {
+        'id': 10,
+        'type': 'con',
+        'name': 'Ario',
+        'window': 1,
+        'window_properties': {'class': 'Ario', 'instance': 'ario',
+                              'title': 'Ario'},
+        'nodes': [],
+    }
+    tree = {
+        'type': 'root',
+        'id': 1,
+        'focus': [2],
+        'nodes': [{
+            'type': 'output',
+            'id': 2,
+            'focus': [3],
+            'nodes': [{
+                'type': 'con',
+                'id': 3,
+                'focus': [4],
+                'nodes': [workspace(4, '1', [ario]),
+                          workspace(5, '2: mail', [])],
+            }],
+        }],
+    }
+    monkeypatch.setattr(session, '_session', FakeSession(tree))
+    runner = CliRunner()
+
+    # One layout and one programs file is written for each workspace.
+    result = runner.invoke(main.main, ['save', '--all', '-d', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    assert 'Saved workspace "1"' in result.output
+    assert 'Saved workspace "2: mail"' in result.output
+    assert 'Saved 2 workspaces' in result.output
+    files = sorted(p.name for p in tmp_path.iterdir()
+                   if not p.name.startswith('.'))
+    assert files == [
+        'workspace_1_apps.json',
+        'workspace_1_layout.json',
+        'workspace_2 mail_apps.json',
+        'workspace_2 mail_layout.json',
+    ]
+    saved = layout.read('1', tmp_path, None)
+    assert saved['nodes'][0]['swallows'] == [
+        {'class': '^Ario$', 'instance': '^ario$'},
+    ]
+
+    # Unchanged workspaces are skipped unless saving is forced.
+    layout_file = tmp_path / 'workspace_1_layout.json'
+    edited = layout_file.read_text() + ' '
+    layout_file.write_text(edited)
+    result = runner.invoke(main.main, ['save', '--all', '-d', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    assert 'Workspace "1" is unchanged' in result.output
+    assert 'Workspace "2: mail" is unchanged' in result.output
+    assert layout_file.read_text() == edited
+    result = runner.invoke(main.main,
+                           ['save', '--all', '--force', '-d', str(tmp_path)])
+    assert 'Saved workspace "1"' in result.output
+    assert layout_file.read_text() != edited
+
+    # --all can't be combined with a single workspace.
+    result = runner.invoke(main.main,
+                           ['save', '--all', '-w', '1', '-d', str(tmp_path)])
+    assert result.exit_code == 1
+    assert '--all cannot be used with --workspace' in result.output
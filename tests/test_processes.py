@@ -0,0 +1,23 @@
+import os
+import subprocess
+
+from i3_resurrect import processes
+
+
+def test_process_snapshot(tmp_path):
+    child = subprocess.Popen(['sleep', '10'], cwd=tmp_path)
+    try:
+        snapshot = processes.ProcessSnapshot()
+        assert child.pid in snapshot.children(os.getpid())
+        details = snapshot.details(child.pid)
+        assert details['cwd'] == str(tmp_path)
+        assert details['cmdline'] == ['sleep', '10']
+    finally:
+        child.kill()
+        child.wait()
+
+    # Details are only read once, and processes which weren't running when
+    # the snapshot was taken aren't looked up.
+    assert snapshot.details(child.pid) == details
+    assert snapshot.details(-1) is None
+    assert snapshot.children(-1) == []
@@ -1,5 +1,9 @@
+from random import Random
+from types import SimpleNamespace
+
 from i3_resurrect import config
 from i3_resurrect import programs
+from i3_resurrect import session
 
 
 def test_get_window_command(monkeypatch):
@@ -157,3 +161,84 @@ def test_get_window_command(monkeypatch):
         '--app=http://instacalc.com',
         '--user-data-dir=.config',
     ]
+
+
+def test_rule_index():
+    random = Random(0)
+    values = {
+        'class': ['A', 'B', 'C'],
+        'instance': ['a', 'b'],
+        'window_role': ['main', 'dialog'],
+        'title': ['x', 'y'],
+    }
+
+    def random_properties():
+        return {
+            criterion: random.choice(options)
+            for criterion, options in values.items()
+            if random.random() < 0.8
+        }
+
+    rules = [random_properties() for _ in range(200)]
+    index = programs.RuleIndex(rules)
+    for _ in range(500):
+        window_properties = random_properties()
+
+        # The best match is the first mapping with the highest score.
+        best_score = 0
+        expected = None
+        for rule in rules:
+            score = programs.calc_rule_match_score(rule, window_properties)
+            if score > best_score:
+                best_score = score
+                expected = rule
+        assert index.best_match(window_properties) is expected
+
+    # The index is reused for the same list of mappings.
+    assert programs.get_rule_index(rules) is programs.get_rule_index(rules)
+    assert programs.get_rule_index(rules) is not \
+        programs.get_rule_index(list(rules))
+
+
+def test_restore(monkeypatch, tmp_path):
+    commands = []
+
+    class FakeSession:
+        def command(self, payload):
+            commands.append(payload)
+            return [SimpleNamespace(success=True, error=None)
+                    for _ in payload.split(';')]
+
+        def batch(self):
+            return session.CommandBatch(self)
+
+    def program(command, working_directory=str(tmp_path)):
+        return {'command': command, 'working_directory': working_directory}
+
+    saved_programs = [
+        program(['editor', 'notes.txt']),
+        program(['term']),
+        program(['term']),
+        program(['term']),
+        program(['browser']),
+    ]
+    running_programs = [
+        # Equal to the saved commands once normalised.
+        program('editor notes.txt'),
+        program(['term', ''], str(tmp_path) + '/'),
+        program(['term']),
+        # Running in another directory.
+        program(['browser'], '/'),
+    ]
+    monkeypatch.setattr(session, '_session', FakeSession())
+    monkeypatch.setattr(programs, 'get_programs',
+                        lambda workspace, numeric: running_programs)
+
+    # Only the programs which aren't running are launched, once for each
+    # time they were saved more often than they are running, all in one
+    # message.
+    programs.restore('1', saved_programs)
+    assert commands == [
+        f'exec "cd \\"{tmp_path}\\" && \\"term\\""'
+        f';exec "cd \\"{tmp_path}\\" && \\"browser\\""',
+    ]
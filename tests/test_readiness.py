@@ -0,0 +1,26 @@
+import threading
+import time
+
+from i3_resurrect import readiness
+
+
+def test_wait_for_paths(monkeypatch, tmp_path):
+    paths = [tmp_path / 'a', tmp_path / 'b']
+    paths[0].touch()
+    threading.Timer(0.05, paths[1].touch).start()
+    assert readiness.wait_for_paths(paths, 5) == set()
+
+    # Paths that never appear are returned once the timeout is reached.
+    start = time.monotonic()
+    assert readiness.wait_for_paths(paths + [tmp_path / 'c'], 0.1) == {
+        tmp_path / 'c',
+    }
+    assert time.monotonic() - start < 1
+
+    # Test polling when inotify isn't available.
+    monkeypatch.setattr(readiness, 'pyinotify', None)
+    threading.Timer(0.05, (tmp_path / 'd').touch).start()
+    assert readiness.wait_for_paths([tmp_path / 'd'], 5) == set()
+    assert readiness.wait_for_paths([tmp_path / 'e'], 0.1) == {
+        tmp_path / 'e',
+    }
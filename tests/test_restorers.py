@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from i3_resurrect import launcher
+from i3_resurrect import restorers
+
+
+def test_run(monkeypatch):
+    monkeypatch.setattr(restorers, '_restorers', [])
+    events = []
+    server_ready = threading.Event()
+
+    def launch(name, launched=True):
+        def launch_apps(context):
+            events.append(f'launch {name}')
+            if name == 'broken':
+                raise OSError('no such program')
+            return launched
+        return launch_apps
+
+    def ready(context):
+        server_ready.wait(1.0)
+        events.append('server ready')
+
+    def launch_browser(context):
+        # Independent restorers run at the same time, so this unblocks the
+        # server.
+        events.append('launch browser')
+        server_ready.set()
+        return True
+
+    restorers.register(restorers.Restorer('server', launch('server'), ready))
+    restorers.register(restorers.Restorer('client', launch('client'),
+                                          requires=['server']))
+    restorers.register(restorers.Restorer('browser', launch_browser,
+                                          window_class='Browser'))
+    restorers.register(restorers.Restorer('broken', launch('broken'),
+                                          window_class='Broken'))
+    restorers.register(restorers.Restorer('idle', launch('idle', False),
+                                          window_class='Idle'))
+    restorers.register(restorers.Restorer('plugin', launch('plugin'),
+                                          requires=['broken']))
+    with pytest.raises(ValueError):
+        restorers.register(restorers.Restorer('other', launch('other'),
+                                              requires=['missing']))
+
+    with launcher.Launcher(max_workers=4) as launches:
+        window_classes = restorers.run(restorers.Context({}, '1', launches))
+
+    # Clients are only launched once their server is ready, and restorers
+    # whose requirements failed are skipped.
+    assert events.index('server ready') < events.index('launch client')
+    assert 'launch browser' in events
+    assert 'launch plugin' not in events
+    # Only the windows of restorers which launched something are expected.
+    assert window_classes == {'Browser'}
@@ -0,0 +1,121 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from i3_resurrect import launcher
+from i3_resurrect import scheduler
+
+
+def test_launch_scheduler(monkeypatch):
+    system = {'load': 0.5, 'idle': 80.0, 'available': 4096 * 1024 * 1024}
+    monkeypatch.setattr(scheduler, 'CPU_SAMPLE_INTERVAL', 0.0)
+    monkeypatch.setattr(scheduler.os, 'cpu_count', lambda: 2)
+    monkeypatch.setattr(scheduler.os, 'getloadavg',
+                        lambda: (system['load'], 0.0, 0.0))
+    monkeypatch.setattr(
+        scheduler.psutil,
+        'cpu_times_percent',
+        lambda interval: SimpleNamespace(idle=system['idle']),
+    )
+    monkeypatch.setattr(
+        scheduler.psutil,
+        'virtual_memory',
+        lambda: SimpleNamespace(available=system['available']),
+    )
+
+    launches = scheduler.LaunchScheduler(max_wait=0.05)
+    assert launches.max_pending == 2
+    assert launches.has_room()
+
+    # Launches are only held back by pending windows if they're counted.
+    terminal = launcher.Launch(['alacritty'], 'Alacritty')
+    browser = launcher.Launch(['qutebrowser'], 'qutebrowser')
+    launches.admit(terminal)
+    launches.admit(browser)
+    assert launches.has_room()
+    launches.count_pending = True
+    assert not launches.has_room()
+
+    # Only windows of the class of a pending launch make room.
+    launches.window_opened({'window_properties': {'class': 'Xterm'}})
+    launches.window_opened({})
+    assert not launches.has_room()
+    launches.window_opened({'window_properties': {'class': 'alacritty'}})
+    assert launches.has_room()
+
+    # As do launches which failed, or whose windows never opened.
+    launches.admit(terminal)
+    assert not launches.has_room()
+    launches.release(terminal)
+    assert launches.has_room()
+    launches.window_timeout = 0.0
+    launches.admit(terminal)
+    assert launches.has_room()
+    launches.window_timeout = 10.0
+
+    for key, busy in [('load', 4.1), ('idle', 5.0), ('available', 1024)]:
+        idle = system[key]
+        system[key] = busy
+        assert not launches.has_room()
+        system[key] = idle
+
+    # A busy system holds launches back for a while but doesn't stop them.
+    system['load'] = 10.0
+    assert launches.admit(launcher.Launch(['kak'])) >= 0.05
+
+
+def test_concurrent_admit(monkeypatch):
+    def getloadavg():
+        # Give other threads the chance to check for room in between.
+        time.sleep(0.01)
+        return (0.0, 0.0, 0.0)
+
+    monkeypatch.setattr(scheduler.os, 'getloadavg', getloadavg)
+    launches = scheduler.LaunchScheduler(max_pending=2, min_cpu_idle=0.0,
+                                         min_available_memory=0, max_wait=0.3)
+    launches.count_pending = True
+    held_back = []
+    threads = [
+        threading.Thread(target=lambda: held_back.append(
+            launches.admit(launcher.Launch(['alacritty']))))
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Only max_pending launches are admitted before windows open.
+    assert sorted(held_back)[2] >= 0.3
+    assert len(launches._pending) == 6
+
+
+def test_cpu_idle_sample_interval(monkeypatch):
+    readings = []
+
+    def cpu_times_percent(interval):
+        readings.append(interval)
+        return SimpleNamespace(idle=0.0)
+
+    monkeypatch.setattr(scheduler.psutil, 'cpu_times_percent',
+                        cpu_times_percent)
+    monkeypatch.setattr(scheduler, 'CPU_SAMPLE_INTERVAL', 0.05)
+    launches = scheduler.LaunchScheduler()
+
+    # Right after the first reading the idle time is unknown, so launches
+    # aren't held back by it, and readings in quick succession are reused.
+    assert launches._get_cpu_idle() is None
+    assert launches._get_cpu_idle() is None
+    assert len(readings) == 1
+    time.sleep(0.05)
+    assert launches._get_cpu_idle() == 0.0
+    assert launches._get_cpu_idle() == 0.0
+    assert len(readings) == 2
+
+
+def test_wrap():
+    assert scheduler.LaunchScheduler().wrap(['kak']) == ['kak']
+    launches = scheduler.LaunchScheduler(niceness=10, ionice_class=3)
+    assert launches.wrap(['kak', '-d']) == [
+        'nice', '-n', '10', 'ionice', '-c', '3', 'kak', '-d',
+    ]
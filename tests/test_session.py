@@ -0,0 +1,111 @@
+import json
+from types import SimpleNamespace
+
+from i3_resurrect import session
+from i3_resurrect import treeutils
+
+
+class FakeConnection:
+    def __init__(self, tree):
+        self.tree = tree
+        self.requests = 0
+
+    def _message(self, message_type, payload):
+        self.requests += 1
+        return json.dumps(self.tree)
+
+
+def test_tree_snapshot(monkeypatch):
+    tree = {
+        'id': 1,
+        'type': 'root',
+        'focus': [2],
+        'nodes': [
+            {
+                'id': 2,
+                'type': 'output',
+                'focus': [3],
+                'nodes': [
+                    {
+                        'id': 3,
+                        'type': 'con',
+                        'focus': [5, 4],
+                        'nodes': [
+                            {'id': 4, 'type': 'workspace', 'name': '1',
+                             'num': 1, 'nodes': []},
+                            {'id': 5, 'type': 'workspace', 'name': '2',
+                             'num': 2, 'nodes': []},
+                        ],
+                    },
+                ],
+            },
+        ],
+    }
+    connection = FakeConnection(tree)
+    monkeypatch.setattr(session, '_session', session.Session(connection))
+
+    # The tree is only fetched once no matter how often it is read.
+    assert treeutils.get_focused_workspace()['name'] == '2'
+    assert treeutils.get_workspace_tree('1', False)['id'] == 4
+    assert treeutils.get_workspace_tree('2', True)['id'] == 5
+    assert [ws['name'] for ws in treeutils.get_workspaces()] == ['1', '2']
+    assert connection.requests == 1
+
+    # Invalidating the snapshot causes it to be fetched again.
+    session.get().invalidate()
+    assert treeutils.get_workspace_tree('1', False)['id'] == 4
+    assert connection.requests == 2
+
+
+def test_tree_without_private_api(monkeypatch):
+    tree = {'id': 1, 'type': 'root', 'nodes': []}
+    connection = SimpleNamespace(
+        get_tree=lambda: SimpleNamespace(ipc_data=tree))
+    assert session.Session(connection).get_tree() == tree
+
+    # The public API is also used if the private one has changed.
+    connection._message = FakeConnection(None)._message
+    monkeypatch.setattr(session, 'GET_TREE', None)
+    assert session.Session(connection).get_tree() == tree
+
+
+class FakeCommandConnection:
+    def __init__(self):
+        self.payloads = []
+
+    def command(self, payload):
+        self.payloads.append(payload)
+        replies = []
+        for command in payload.split(';'):
+            # Stop at a command which can't be parsed, like i3.
+            if command == 'bad':
+                replies.append(SimpleNamespace(success=False,
+                                               error='parse error'))
+                break
+            # Commands separated by ',' each get a reply.
+            for _ in command.split(','):
+                replies.append(SimpleNamespace(success=True, error=None))
+        return replies
+
+
+def test_command_batch():
+    connection = FakeCommandConnection()
+    i3 = session.Session(connection)
+
+    with i3.batch(max_size=21) as batch:
+        batch.add('exec "ab"')
+        batch.add('[id=1] kill')
+        batch.add('mark x, focus')
+    # Commands are joined until the message would be too long.
+    assert connection.payloads == ['exec "ab";[id=1] kill', 'mark x, focus']
+    assert [len(replies) for _, replies in batch.results] == [1, 1, 2]
+    assert batch.errors() == []
+
+    with i3.batch() as batch:
+        batch.add('bad')
+        batch.add('focus')
+    assert batch.errors() == [('bad', 'parse error'), ('focus', 'Not run')]
+
+    # Separators in quoted strings don't separate commands.
+    assert session.count_commands(r'exec "a; b \"c, d\""') == 1
+    assert session.count_commands('[class="x"] move left, focus') == 2
@@ -0,0 +1,73 @@
+import json
+
+from i3_resurrect import storage
+from i3_resurrect import treeutils
+
+
+def test_write_json(tmp_path):
+    path = tmp_path / 'data.json'
+    path.write_text('old')
+    data = {'a': [1, 2, {'b': None}]}
+
+    storage.write_json(path, data)
+    assert path.read_text() == json.dumps(data, indent=2)
+
+    storage.write_json(path, data, compact=True)
+    assert path.read_text() == '{"a":[1,2,{"b":null}]}'
+
+    # No temporary files are left behind.
+    assert [p.name for p in tmp_path.iterdir()] == ['data.json']
+
+
+def test_compact_layout(tmp_path):
+    leaf = {
+        'border': 'pixel',
+        'current_border_width': -1,
+        'floating': 'auto_off',
+        'geometry': {'x': 0, 'y': 0, 'width': 0, 'height': 0},
+        'marks': [],
+        'name': None,
+        'orientation': 'none',
+        'sticky': False,
+        'type': 'con',
+        'swallows': [{'class': '^Ario$'}],
+    }
+    tree = {
+        'type': 'workspace',
+        'layout': 'splith',
+        'nodes': [
+            {'type': 'con', 'layout': 'tabbed', 'marks': ['a'],
+             'nodes': [dict(leaf), dict(leaf, sticky=True)]},
+        ],
+        'floating_nodes': [
+            {'type': 'floating_con', 'nodes': [dict(leaf)]},
+        ],
+    }
+    path = tmp_path / 'layout.json'
+    storage.write_json(path, tree, compact=True)
+    compact = json.loads(path.read_text())
+
+    compact_leaf = {
+        'border': 'pixel',
+        'orientation': 'none',
+        'swallows': [{'class': '^Ario$'}],
+    }
+    assert compact == {
+        'type': 'workspace',
+        'layout': 'splith',
+        'nodes': [
+            {'layout': 'tabbed', 'marks': ['a'],
+             'nodes': [compact_leaf, dict(compact_leaf, sticky=True)]},
+        ],
+        'floating_nodes': [
+            {'type': 'floating_con', 'nodes': [compact_leaf]},
+        ],
+    }
+
+    # Filling in the defaults gives back the original tree.
+    for _, _, node in treeutils.walk(compact):
+        for key, value in treeutils.DEFAULT_ATTRIBUTES.items():
+            if key in leaf:
+                node.setdefault(key, value)
+    assert compact['nodes'][0]['nodes'][0] == leaf
+    assert compact['floating_nodes'][0]['nodes'][0] == leaf
@@ -0,0 +1,46 @@
+import json
+import threading
+
+from i3_resurrect import launcher
+from i3_resurrect import trace
+
+
+def test_trace(monkeypatch, tmp_path):
+    monkeypatch.setattr(trace, '_tracer', None)
+
+    # Nothing is recorded until tracing is enabled.
+    with trace.span('ignored'):
+        trace.instant('ignored')
+    trace.write(tmp_path / 'trace.json')
+    assert not (tmp_path / 'trace.json').exists()
+
+    trace.enable()
+    with trace.span('outer', workspace='1'):
+        trace.instant('window::new', 'window', id=1)
+    thread = threading.Thread(target=trace.instant, args=('other',),
+                              name='worker')
+    thread.start()
+    thread.join()
+    launcher.Launcher().run(['true'])
+
+    trace.write(tmp_path / 'trace.json')
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    by_name = {event['name']: event for event in events}
+
+    outer = by_name['outer']
+    assert outer['ph'] == 'X'
+    assert outer['args'] == {'workspace': '1'}
+    instant = by_name['window::new']
+    assert instant['ph'] == 'i'
+    assert instant['cat'] == 'window'
+    assert outer['ts'] <= instant['ts'] <= outer['ts'] + outer['dur']
+
+    # Events from other threads get their own named track.
+    assert by_name['other']['tid'] != outer['tid']
+    thread_names = {event['tid']: event['args']['name'] for event in events
+                    if event['name'] == 'thread_name'}
+    assert thread_names[by_name['other']['tid']] == 'worker'
+
+    launch = by_name['true']
+    assert launch['cat'] == 'launch'
+    assert launch['args']['returncode'] == 0
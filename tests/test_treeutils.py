@@ -346,3 +346,151 @@ def test_windows_in_container():
     }
     windows = treeutils.get_leaves(workspace_tree)
     assert windows is not None
+
+
+def test_deep_tree(monkeypatch):
+    monkeypatch.setattr(treeutils.config, '_config', {})
+
+    # Build a chain of split containers much deeper than the recursion limit
+    # with a window at the bottom and a floating window at the top.
+    window = {
+        'type': 'con',
+        'window_properties': {'class': 'Alacritty', 'instance': 'Alacritty'},
+        'nodes': [],
+    }
+    floating_window = {
+        'type': 'floating_con',
+        'rect': {'x': 0, 'y': 0, 'width': 10, 'height': 10},
+        'window_properties': {'class': 'Ario', 'instance': 'ario'},
+        'nodes': [],
+    }
+    tree = window
+    for _ in range(5000):
+        tree = {'type': 'con', 'layout': 'splitv', 'nodes': [tree]}
+    tree['floating_nodes'] = [floating_window]
+
+    assert list(treeutils.get_leaves(tree)) == [window, floating_window]
+
+    processed = treeutils.process_node(tree, ['class'])
+    assert processed['floating_nodes'] == [{
+        'type': 'floating_con',
+        'rect': {'x': 0, 'y': 0, 'width': 10, 'height': 10},
+        'swallows': [{'class': '^Ario$'}],
+    }]
+    depth = 0
+    node = processed
+    while 'nodes' in node:
+        node = node['nodes'][0]
+        depth += 1
+    assert depth == 5000
+    assert node == {'type': 'con', 'swallows': [{'class': '^Alacritty$'}]}
+
+
+def test_workspace_index():
+    root = {
+        'id': 1,
+        'type': 'root',
+        'nodes': [
+            {
+                'id': 2,
+                'type': 'output',
+                'name': '__i3',
+                'nodes': [
+                    {
+                        'id': 3,
+                        'type': 'con',
+                        'name': 'content',
+                        'nodes': [
+                            {'id': 4, 'type': 'workspace',
+                             'name': '__i3_scratch', 'num': -1, 'nodes': []},
+                        ],
+                    },
+                ],
+            },
+            {
+                'id': 5,
+                'type': 'output',
+                'name': 'HDMI-1',
+                'nodes': [
+                    {
+                        'id': 6,
+                        'type': 'dockarea',
+                        'name': 'topdock',
+                        'nodes': [
+                            {'id': 7, 'type': 'con', 'name': 'mail',
+                             'nodes': []},
+                        ],
+                    },
+                    {
+                        'id': 8,
+                        'type': 'con',
+                        'name': 'content',
+                        'nodes': [
+                            {'id': 9, 'type': 'workspace', 'name': '1',
+                             'num': 1, 'nodes': []},
+                            {'id': 10, 'type': 'workspace', 'name': 'mail',
+                             'num': None, 'nodes': []},
+                            {'id': 11, 'type': 'workspace', 'name': '1:web',
+                             'num': 1, 'nodes': []},
+                        ],
+                    },
+                ],
+            },
+        ],
+    }
+    index = treeutils.WorkspaceIndex(root)
+
+    # Dock clients are never mistaken for workspaces.
+    assert index.lookup('mail', False)['id'] == 10
+
+    # The first workspace with a number is found when selecting by number.
+    assert index.lookup('1', True)['id'] == 9
+    assert index.lookup('1:web', False)['id'] == 11
+    assert index.lookup('web', True) == {}
+    assert index.lookup('2', False) == {}
+    assert index.by_id[11]['name'] == '1:web'
+    assert [ws['id'] for ws in index.workspaces] == [4, 9, 10, 11]
+
+
+def test_workspaces_by_focus(monkeypatch):
+    def output(con_id, name, focus, workspaces):
+        return {
+            'id': con_id,
+            'type': 'output',
+            'name': name,
+            'nodes': [
+                {
+                    'id': con_id + 1,
+                    'type': 'con',
+                    'name': 'content',
+                    'focus': focus,
+                    'nodes': [
+                        {'id': ws_id, 'type': 'workspace', 'name': ws_name,
+                         'nodes': []}
+                        for ws_id, ws_name in workspaces
+                    ],
+                },
+            ],
+        }
+
+    root = {
+        'id': 1,
+        'type': 'root',
+        'focus': [30, 20, 10],
+        'nodes': [
+            output(10, '__i3', [12], [(12, '__i3_scratch')]),
+            output(20, 'HDMI-1', [23, 22], [(22, '1'), (23, '2'), (24, '3')]),
+            output(30, 'DP-1', [33, 32], [(32, '4'), (33, '5')]),
+        ],
+    }
+
+    class FakeSession:
+        def get_tree(self):
+            return root
+
+    monkeypatch.setattr(treeutils.session, '_session', FakeSession())
+
+    # Visible workspaces come first, starting with the focused output, then
+    # the ones which were visible before them, then the rest.
+    names = [ws['name'] for ws in treeutils.get_workspaces_by_focus()]
+    assert names == ['5', '2', '4', '1', '3']
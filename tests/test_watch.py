@@ -0,0 +1,79 @@
+import threading
+
+from i3_resurrect import watch
+
+
+def test_swallow_tracker():
+    tracker = watch.SwallowTracker()
+    tracker.add([
+        {'id': 1, 'swallows': [{'class': '^Ario$'}]},
+        {'id': 2, 'swallows': [{'class': '^Alacritty$', 'title': '^vim$'}]},
+    ])
+
+    # Windows which don't fill a placeholder are recorded separately.
+    tracker.window_opened({'id': 3, 'window': 30,
+                           'window_properties': {'class': 'Xterm'}})
+    tracker.window_opened({'id': 1, 'window_properties': {'class': 'Ario'}})
+    assert not tracker.wait(0.01)
+
+    # Waiting ends as soon as the last placeholder is filled.
+    opener = threading.Timer(
+        0.05,
+        tracker.window_opened,
+        [{'id': 2, 'window_properties': {'class': 'Alacritty'}}],
+    )
+    opener.start()
+    assert tracker.wait(5)
+    opener.join()
+
+    assert [criteria for criteria, _ in tracker.swallowed] == [
+        [{'class': '^Ario$'}],
+        [{'class': '^Alacritty$', 'title': '^vim$'}],
+    ]
+    assert tracker.unexpected == {30: {'class': 'Xterm'}}
+
+
+def test_swallow_tracker_discard_ignore():
+    tracker = watch.SwallowTracker()
+    placeholders = [
+        {'id': 1, 'swallows': [{'class': '^Ario$'}]},
+        {'id': 2, 'swallows': [{'class': '^Alacritty$'}]},
+    ]
+    tracker.add(placeholders)
+
+    # Remapped windows aren't reported, whether they were seen before or
+    # after being ignored.
+    tracker.window_opened({'id': 3, 'window': 30})
+    tracker.ignore([30, 40])
+    tracker.window_opened({'id': 4, 'window': 40})
+    assert tracker.unexpected == {}
+
+    # Nothing is waited for once the placeholders are discarded.
+    tracker.discard(watch.get_unlaunched(placeholders, {'Alacritty'}))
+    assert not tracker.wait(0.01)
+    tracker.discard(placeholders)
+    assert tracker.wait(0)
+
+
+def test_get_unlaunched():
+    placeholders = [
+        {'id': 1, 'swallows': [{'class': '^Ario$'}]},
+        {'id': 2, 'swallows': [{'class': '^Xterm$'},
+                               {'class': '^Alacritty$'}]},
+        {'id': 3, 'swallows': [{'title': '^vim$'}]},
+        {'id': 4, 'swallows': [{'class': '^qutebrowser$'}]},
+    ]
+    unlaunched = watch.get_unlaunched(placeholders,
+                                      {'Alacritty', 'qutebrowser'})
+    assert [placeholder['id'] for placeholder in unlaunched] == [1]
+
+
+def test_swallow_tracker_report(capsys):
+    tracker = watch.SwallowTracker()
+    tracker.add([{'id': 1, 'swallows': [{'class': '^Ario$'},
+                                        {'instance': '^ario$'}]}])
+    tracker.report()
+    assert capsys.readouterr().err == (
+        '1 placeholder(s) were not swallowed:\n'
+        '  [class="^Ario$"] or [instance="^ario$"]\n'
+    )
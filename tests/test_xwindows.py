@@ -0,0 +1,181 @@
+from types import SimpleNamespace
+
+from i3_resurrect import xwindows
+
+
+def test_xdotool_batch(monkeypatch):
+    calls = []
+
+    def call(command, **kwargs):
+        calls.append(command)
+        return 0
+
+    monkeypatch.setattr(xwindows, 'xdisplay', None)
+    monkeypatch.setattr(xwindows.subprocess, 'call', call)
+
+    # All windows are handled by a single xdotool process.
+    with xwindows.WindowOps() as window_ops:
+        assert window_ops.backend == 'xdotool'
+        window_ops.unmap([1, 2, 3])
+        window_ops.kill([])
+    assert calls == [
+        ['xdotool', 'windowunmap', '1', 'windowunmap', '2', 'windowunmap', '3'],
+    ]
+
+    # If the chain fails each window is retried separately.
+    calls.clear()
+    monkeypatch.setattr(xwindows.subprocess, 'call',
+                        lambda command, **kwargs: call(command) or 1)
+    with xwindows.WindowOps() as window_ops:
+        window_ops.map([1, 2])
+    assert calls == [
+        ['xdotool', 'windowmap', '1', 'windowmap', '2'],
+        ['xdotool', 'windowmap', '1'],
+        ['xdotool', 'windowmap', '2'],
+    ]
+
+
+def test_xlib(monkeypatch):
+    requests = []
+
+    class Window:
+        def __init__(self, window_id):
+            self.window_id = window_id
+
+        def map(self):
+            requests.append(('map', self.window_id))
+
+        def unmap(self):
+            requests.append(('unmap', self.window_id))
+
+        def kill_client(self):
+            requests.append(('kill_client', self.window_id))
+
+    class Display:
+        def set_error_handler(self, handler):
+            pass
+
+        def create_resource_object(self, resource_type, window_id):
+            return Window(window_id)
+
+        def sync(self):
+            requests.append('sync')
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(xwindows, 'xdisplay', SimpleNamespace(Display=Display))
+
+    with xwindows.WindowOps() as window_ops:
+        assert window_ops.backend == 'xlib'
+        window_ops.unmap([1, 2])
+        window_ops.kill([3])
+        window_ops.map([1, 2])
+    assert requests == [
+        ('unmap', 1), ('unmap', 2), 'sync',
+        ('kill_client', 3), 'sync',
+        ('map', 1), ('map', 2), 'sync',
+    ]
+
+
+def test_parse_xprop():
+    assert xwindows.parse_xprop(
+        '_NET_WM_PID(CARDINAL) = 1234\n'
+        'WM_CLASS(STRING) = "kitty", "Kitty"\n'
+        '_NET_WM_NAME(UTF8_STRING) = "say \\"hi\\", ok"\n'
+        'WM_NAME:  not found.\n'
+    ) == {
+        '_NET_WM_PID': [1234],
+        'WM_CLASS': ['kitty', 'Kitty'],
+        '_NET_WM_NAME': ['say "hi", ok'],
+    }
+
+
+def test_read_properties_xprop(monkeypatch):
+    calls = []
+
+    def run(command, **kwargs):
+        calls.append(command)
+        # The second window no longer exists, so xprop prints nothing.
+        output = ('_NET_WM_PID(CARDINAL) = 10\n'
+                  'WM_CLASS(STRING) = "term", "Term"\n'
+                  'WM_NAME(STRING) = "~"\n'
+                  '.\n'
+                  '.\n'
+                  '_NET_WM_PID:  not found.\n'
+                  '.\n')
+        return SimpleNamespace(stdout=output.encode())
+
+    monkeypatch.setattr(xwindows, 'xdisplay', None)
+    monkeypatch.setattr(xwindows.subprocess, 'run', run)
+
+    # Every window is read by a single process.
+    with xwindows.PropertyReader() as reader:
+        assert reader.backend == 'xprop'
+        assert reader.read([1, 2, 3], names=True) == {
+            1: {'pid': 10, 'instance': 'term', 'class': 'Term', 'title': '~'},
+            2: {'pid': 0},
+            3: {'pid': 0},
+        }
+        assert reader.read([]) == {}
+    assert len(calls) == 1
+    assert calls[0][-3:] == ['1', '2', '3']
+
+
+def test_read_properties_xlib(monkeypatch):
+    atoms = {'_NET_WM_PID': 1, 'WM_CLASS': 2, '_NET_WM_NAME': 3,
+             'WM_NAME': 4}
+    values = {
+        (1, 1): (6, (32, [10])),
+        (1, 2): (31, (8, b'term\0Term\0')),
+        (1, 3): (5, (8, b'~')),
+        (2, 1): (6, (32, [20])),
+    }
+    sent = []
+
+    class BadWindow(xwindows.xerror.XError):
+        def __init__(self):
+            pass
+
+    class GetProperty:
+        def __init__(self, display, defer, window, property, **kwargs):
+            assert defer
+            sent.append((window, property))
+            self.window = window
+            self.property = property
+
+        def reply(self):
+            # Every request has been sent before any reply is waited for.
+            assert len(sent) == 12
+            if self.window == 3:
+                raise BadWindow()
+            self.property_type, self.value = values.get(
+                (self.window, self.property), (0, None))
+
+    class Display:
+        display = None
+
+        def set_error_handler(self, handler):
+            pass
+
+        def intern_atom(self, name):
+            return atoms[name]
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(xwindows, 'xdisplay', SimpleNamespace(Display=Display))
+    monkeypatch.setattr(xwindows, 'xrequest',
+                        SimpleNamespace(GetProperty=GetProperty))
+    monkeypatch.setattr(xwindows, 'X', SimpleNamespace(AnyPropertyType=0,
+                                                       NONE=0))
+    monkeypatch.setattr(xwindows, 'Xatom', SimpleNamespace(CARDINAL=6))
+
+    with xwindows.PropertyReader() as reader:
+        assert reader.backend == 'xlib'
+        assert reader.read([1, 2, 3], names=True) == {
+            1: {'pid': 10, 'instance': 'term', 'class': 'Term', 'title': '~'},
+            2: {'pid': 20},
+            # The window no longer exists.
+            3: {'pid': 0},
+        }